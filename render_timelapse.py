@@ -0,0 +1,91 @@
+import os
+import argparse
+
+#Render a timelapse without a window or display server, e.g. on a render node:
+#   python render_timelapse.py /path/to/project goes_east goes_west --resolution high_res --size 3840 2160
+#the frames are written to images/timelapses/timelapse_N in the project folder like the viewer's timelapses,
+#or encoded into images/timelapses/timelapse_N.mp4 with --video
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Render a timelapse of processed satellite images offscreen.')
+    parser.add_argument('project_folder', help='the project folder the images were processed into')
+    parser.add_argument('satellites', nargs='+', help='satellites to draw (goes_east, goes_west, himawari, meteosat_9, meteosat_10)')
+    parser.add_argument('--resolution', default='low_res', choices=['low_res', 'medium_res', 'high_res'])
+    parser.add_argument('--size', nargs=2, type=int, default=[1920, 1080], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--backend', default='egl', choices=['egl', 'osmesa'])
+    parser.add_argument('--lon', type=float, default=None, help='longitude the camera looks at, in degrees')
+    parser.add_argument('--lat', type=float, default=0.0, help='latitude the camera looks at, in degrees')
+    parser.add_argument('--zoom', type=float, default=0.5, help='the zoom factor, 0.5 fits the globe in the view')
+    parser.add_argument('--blended', action='store_true', help='use the images blended during processing')
+    parser.add_argument('--gpu-blending', action='store_true', help='blend raw frames and fade the limbs on the GPU')
+    parser.add_argument('--video', action='store_true', help='encode the frames into a video instead of saving PNGs')
+    parser.add_argument('--frame-rate', type=float, default=3.0, help='timestamps shown per second of video')
+    parser.add_argument('--fps', type=float, default=20.0, help='frames per second of the video when blending')
+    parser.add_argument('--no-blend', action='store_true', help="don't blend frames between the timestamps")
+
+    return parser.parse_args()
+
+def get_timelapse_counter(project_folder : str) -> int:
+    counter = 0
+
+    while (os.path.exists(project_folder + f'/images/timelapses/timelapse_{counter}') or
+           os.path.exists(project_folder + f'/images/timelapses/timelapse_{counter}.mp4')):
+        counter += 1
+
+    return counter
+
+def render(args) -> None:
+    #the OpenGL modules are imported after the platform is chosen
+    from OpenGL.GL import glClearColor, glClear, glEnable, glDisable, GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_BLEND, GL_CULL_FACE
+    from src.offscreen import OffscreenContext, OffscreenFramebuffer
+    from src.opengl_helper import GLInstance
+    from src.timelapse import Timelapse
+    from math import radians
+
+    width, height = args.size
+    context = OffscreenContext()
+    framebuffer = OffscreenFramebuffer(width, height)
+    framebuffer.bind()
+
+    #the same state as OpenGLCanvas.initializeGL
+    glClearColor(0.0725, 0.025, 0.05, 1.0)
+    glEnable(GL_DEPTH_TEST)
+    glDisable(GL_BLEND)
+    glDisable(GL_CULL_FACE)
+
+    gl = GLInstance(width, height)
+    gl.shaders.load()
+    gl.gpu_blending = args.gpu_blending
+
+    camera = gl.camera
+    camera.aspect = width / height
+    camera.zoom_factor = args.zoom
+    camera.adjust_zoom(0.0)
+
+    if (args.lon is not None):
+        camera.yaw, camera.pitch = radians(args.lon), radians(args.lat)
+        camera.rotate_origin(0.0, 0.0)
+
+    for satellite in args.satellites:
+        gl.load_satellite(satellite)
+
+    def paint():
+        framebuffer.bind()
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        gl.render(0.0, 0.0)
+
+    timelapse = Timelapse(gl, args.satellites, args.project_folder, args.resolution, args.blended)
+    counter = get_timelapse_counter(args.project_folder)
+    video = {'frame_rate': args.frame_rate, 'fps': args.fps, 'blend': not args.no_blend} if args.video else None
+    print(f'Rendering {len(timelapse.image_groups)} frames to timelapse_{counter}...')
+    timelapse.render(paint, width, height, counter, video)
+
+    framebuffer.delete()
+    context.delete()
+    print('Done!')
+
+if __name__ == '__main__':
+    args = parse_args()
+    #PyOpenGL picks its platform when it is first imported
+    os.environ['PYOPENGL_PLATFORM'] = args.backend
+    render(args)
@@ -1,17 +1,154 @@
 #version 400
 
 uniform sampler2D image;
+uniform sampler2DArray imageArray;
+uniform bool useTextureArray;
+uniform vec2 frameLayers;
+uniform float frameMix;
 uniform float time;
 uniform int numLayers;
 
+//geostationary projection of the satellite, see SatelliteProjection
+uniform bool useGeosProjection;
+uniform float geosLon0;
+uniform float geosRadiusG;
+uniform float geosRadiusP;
+uniform bool geosSweepX;
+uniform vec4 geosExtent;
+uniform vec2 tileOffset;
+uniform vec2 tileScale;
+uniform vec3 viewDirection;
+
+//when accumulating, every satellite adds its color weighted by how well it sees the point
+uniform bool accumulate;
+uniform float blendSharpness;
+//cosines of the viewing zenith angles where the limb fade starts and where it reaches zero
+uniform vec2 limbZenith;
+
+//composite recipe evaluated from the raw bands packed into the texture channels, see CompositeRecipe
+uniform bool useRecipe;
+uniform mat4 recipeMatrix;
+uniform vec4 recipeBandScale;
+uniform vec4 recipeBandOffset;
+uniform vec3 recipeMin;
+uniform vec3 recipeMax;
+uniform vec3 recipeGamma;
+uniform int recipeBands;
+
+//frame pyramid whose visible tiles are streamed into an atlas, see PyramidStreamer. The page table holds the
+//atlas slot of every tile, with the levels stacked vertically
+uniform bool usePyramid;
+uniform sampler2D pyramidAtlas;
+uniform sampler2D pyramidPages;
+uniform int pyramidLevels;
+uniform int pyramidMinLevel;
+uniform vec2 pyramidSize;
+uniform float pyramidTileContent;
+uniform float pyramidTileBorder;
+uniform float pyramidTileSize;
+uniform vec2 pyramidAtlasSlots;
+uniform ivec2 pyramidPageOffsets[16];
+uniform ivec2 pyramidPageSizes[16];
+
 in vec2 texCoord;
 in vec3 vertexCoord;
 
-void main() {
-   //float interp_value = time * numLayers;
-   //float layer1 = floor(interp_value);
-   //float layer2 = layer1 + 1.0;
+//the level is chosen from the screen space size of a texel, no finer than the level that is streamed for
+//the current zoom. Coarser levels are used while a tile isn't in the atlas yet
+vec4 samplePyramid(vec2 coord) {
+   vec2 texel = coord * pyramidSize;
+   float footprint = max(length(dFdx(texel)), length(dFdy(texel)));
+   int level = clamp(int(floor(log2(max(footprint, 1.0)))), pyramidMinLevel, pyramidLevels - 1);
+
+   for (int l = level; l < pyramidLevels; l++) {
+      vec2 levelTexel = texel / exp2(float(l));
+      ivec2 tile = clamp(ivec2(floor(levelTexel / pyramidTileContent)), ivec2(0), pyramidPageSizes[l] - 1);
+      vec4 page = texelFetch(pyramidPages, pyramidPageOffsets[l] + tile, 0);
+
+      if (page.b > 0.5) {
+         vec2 atlasTexel = round(page.rg * 255.0) * pyramidTileSize + levelTexel - vec2(tile) * pyramidTileContent + pyramidTileBorder;
+
+         return textureLod(pyramidAtlas, atlasTexel / (pyramidAtlasSlots * pyramidTileSize), 0.0);
+      }
+   }
+
+   //tiles without pixels are never streamed
+   return vec4(0.0);
+}
+
+//with array textures the two frames around the playback position are blended, frameLayers are their layers
+//in the array (or ring) texture and frameMix how far the position is between them
+vec4 sampleImage(vec2 coord) {
+   if (usePyramid) {
+      return samplePyramid(coord);
+   }
+
+   if (useTextureArray) {
+      return mix(texture(imageArray, vec3(coord, frameLayers.x)), texture(imageArray, vec3(coord, frameLayers.y)), frameMix);
+   }
+
+   return texture(image, coord);
+}
+
+//the mesh triangles are flat, so the fragment is moved along the (orthographic) view ray onto the unit sphere
+vec3 spherePoint(vec3 p) {
+   float pd = dot(p, viewDirection);
+   float disc = pd * pd - dot(p, p) + 1.0;
+
+   return p - (pd + sqrt(max(disc, 0.0))) * viewDirection;
+}
+
+//PROJ's geos forward projection into the tile's texture coordinates. Returns false if the satellite
+//can't see the point
+bool geosProject(vec3 p, out vec2 coord) {
+   vec3 n = normalize(p);
+   float lon = atan(n.y, n.x) - geosLon0;
+   float lat = asin(clamp(n.z, -1.0, 1.0));
+
+   float rp2 = geosRadiusP * geosRadiusP;
+   float latc = atan(rp2 * tan(lat));
+   float r = geosRadiusP / length(vec2(geosRadiusP * cos(latc), sin(latc)));
+   vec3 v = vec3(r * cos(lon) * cos(latc), r * sin(lon) * cos(latc), r * sin(latc));
+
+   if ((geosRadiusG - v.x) * v.x - v.y * v.y - v.z * v.z / rp2 < 0.0) {
+      return false;
+   }
+
+   float tmp = geosRadiusG - v.x;
+   vec2 angles;
 
+   if (geosSweepX) {
+      angles = vec2(atan(v.y / length(vec2(v.z, tmp))), atan(v.z / tmp));
+   }
+   else {
+      angles = vec2(atan(v.y / tmp), atan(v.z / length(vec2(v.y, tmp))));
+   }
+
+   //the first row of the image is the top of the extent
+   vec2 imageCoord = vec2((angles.x - geosExtent.x) / (geosExtent.z - geosExtent.x),
+                          (geosExtent.w - angles.y) / (geosExtent.w - geosExtent.y));
+   coord = (imageCoord - tileOffset) / tileScale;
+
+   return true;
+}
+
+//combine the calibrated bands linearly, then stretch and gamma correct each output channel
+vec3 applyRecipe(vec4 bands) {
+   vec4 values = bands * recipeBandScale + recipeBandOffset;
+   vec3 combined = (recipeMatrix * values).rgb;
+   vec3 stretched = clamp((combined - recipeMin) / (recipeMax - recipeMin), 0.0, 1.0);
+
+   return pow(stretched, 1.0 / recipeGamma);
+}
+
+//cosine of the angle between the surface normal and the direction to the satellite
+float satelliteCosZenith(vec3 p) {
+   vec3 satellite = geosRadiusG * vec3(cos(geosLon0), sin(geosLon0), 0.0);
+
+   return dot(normalize(p), normalize(satellite - p));
+}
+
+void main() {
    vec4 color;
    vec4 color1 = vec4(0.1, 0.3, 0.3, 1.0);
    vec4 color2 = vec4(0.1, 0.4, 0.2, 1.0);
@@ -19,24 +156,58 @@ void main() {
    float g_dist = color2.g - color1.g;
    float b_dist = color2.b - color1.b;
 
-   if (texture(image, texCoord).a < 0.2) {
+   vec2 coord = texCoord;
+   vec3 position = vertexCoord;
+
+   if (useGeosProjection) {
+      position = spherePoint(vertexCoord);
+
+      if (!geosProject(position, coord)) {
+         discard;
+      }
+   }
+
+   vec4 sampled = sampleImage(coord);
+
+   if (useRecipe) {
+      //a band value of 0 marks pixels without data, filtered values below the first step touch one
+      for (int i = 0; i < recipeBands; i++) {
+         if (sampled[i] < 1.0 / 255.0) {
+            discard;
+         }
+      }
+
+      sampled = vec4(applyRecipe(sampled), 1.0);
+   }
+
+   if (sampled.a < 0.2) {
       discard;
    }
 
-   if (texCoord.x < 0.0 || texCoord.x > 1.0 || texCoord.y < 0.0 || texCoord.y > 1.0) {
+   if (coord.x < 0.0 || coord.x > 1.0 || coord.y < 0.0 || coord.y > 1.0) {
       discard;
    }
-   vec3 norm_vertex = normalize(vertexCoord);
+   vec3 norm_vertex = normalize(position);
 
    vec4 offset = vec4(r_dist * norm_vertex.z, g_dist * norm_vertex.y, b_dist * norm_vertex.x, 1.0);
 
    //this is the value of the default image
-   if (texture(image, texCoord).ra == vec2(1.0, 1.0)) {
+   if (!useRecipe && sampled.ra == vec2(1.0, 1.0)) {
       color = vec4(offset.r + color1.r, offset.g + color1.g, offset.b + color1.b, 1.0);//#vec4(normalize(vertexCoord) / 1.5, 1.0);
    }
    else {
-      color = vec4(texture(image, texCoord).rgb, 1.0);
+      color = vec4(sampled.rgb, 1.0);
+   }
+
+   if (accumulate) {
+      float cosZenith = satelliteCosZenith(position);
+      float fade = clamp((cosZenith - limbZenith.y) / (limbZenith.x - limbZenith.y), 0.0, 1.0);
+      float weight = fade * pow(max(cosZenith, 0.0), blendSharpness);
+
+      gl_FragData[0] = vec4(color.rgb * weight, weight);
+      gl_FragData[1] = vec4(fade, 0.0, 0.0, 0.0);
+      return;
    }
 
-   gl_FragColor = color;
-}
\ No newline at end of file
+   gl_FragData[0] = color;
+}
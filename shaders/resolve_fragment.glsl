@@ -0,0 +1,18 @@
+#version 400
+
+//sum of color * weight and of the weights of every satellite that covers the pixel
+uniform sampler2D accumulation;
+//sum of the limb fade of every satellite that covers the pixel
+uniform sampler2D coverage;
+
+void main() {
+   ivec2 pixel = ivec2(gl_FragCoord.xy);
+   vec4 sum = texelFetch(accumulation, pixel, 0);
+   float alpha = clamp(texelFetch(coverage, pixel, 0).r, 0.0, 1.0);
+
+   if (sum.a <= 0.0 || alpha <= 0.0) {
+      discard;
+   }
+
+   gl_FragColor = vec4(sum.rgb / sum.a, alpha);
+}
@@ -0,0 +1,9 @@
+#version 400
+
+//a single triangle that covers the screen, the vertices are generated from gl_VertexID
+void main()
+{
+    vec2 uv = vec2((gl_VertexID << 1) & 2, gl_VertexID & 2);
+
+    gl_Position = vec4(uv * 2.0 - 1.0, 0.0, 1.0);
+}
@@ -0,0 +1,118 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.data_processor import ImageProcessor
+from src.image_handler import TiffImage, ImageBlender
+
+from tqdm import tqdm
+
+#The blending masks form a small dependency graph. The geometry of each satellite (its area definition and
+#TiffImage) is generated once per resolution, and every pair mask of that resolution depends on the geometry
+#of its two satellites. Pair masks don't depend on each other, so all of them, across every resolution,
+#are built as a single job on a process pool.
+class AssetBuilder():
+    def __init__(self, neighboring_satellites : dict, resolutions : list, workers : int=None) -> None:
+        self.neighboring_satellites = neighboring_satellites
+        self.resolutions = resolutions
+        self.workers = workers or os.cpu_count() or 1
+
+    #returns the pair masks to build as (resolution, satellite, neighbor) tuples. If a list of missing masks
+    #is given only those are built, otherwise every mask of every resolution is
+    def get_pair_tasks(self, missing : list=None) -> list:
+        if missing is not None:
+            return [task for task in missing if task[0] in self.resolutions]
+
+        return [(res, satellite, neighbor) for res in self.resolutions
+                for satellite in self.neighboring_satellites
+                for neighbor in self.neighboring_satellites[satellite]]
+
+    #each (resolution, satellite) geometry is only needed once, no matter how many pairs it appears in
+    def _get_geometry_tasks(self, pair_tasks : list) -> list:
+        tasks = []
+
+        for res, satellite, neighbor in pair_tasks:
+            tasks.extend([(res, satellite), (res, neighbor)])
+
+        return list(dict.fromkeys(tasks))
+
+    def _build_geometry(self, geometry_tasks : list) -> dict:
+        processors = {}
+        geometry = {}
+
+        for res, satellite in tqdm(geometry_tasks, desc='Generating satellite geometry...'):
+            if res not in processors:
+                processors[res] = ImageProcessor('')
+                processors[res].specify_image_params(res)
+
+            try:
+                area_def = processors[res].get_area_definition(satellite)
+                geometry[(res, satellite)] = TiffImage(satellite, res, area_def)
+            except Exception as e:
+                print(f'Failed to generate {res} geometry for {satellite}.')
+                print(e)
+
+        return geometry
+
+    #build the pair masks and return the ones that failed
+    def build(self, missing : list=None) -> list:
+        pair_tasks = self.get_pair_tasks(missing)
+        geometry = self._build_geometry(self._get_geometry_tasks(pair_tasks))
+        failed = []
+
+        for res in self.resolutions:
+            os.makedirs(f'images/blending_masks/{res}/', exist_ok=True)
+
+        #spawn the workers so they don't inherit the GUI's threads and OpenGL state
+        context = multiprocessing.get_context('spawn')
+
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            futures = {}
+
+            for res, satellite, neighbor in pair_tasks:
+                if (res, satellite) in geometry and (res, neighbor) in geometry:
+                    future = executor.submit(_build_pair_mask, geometry[(res, satellite)], geometry[(res, neighbor)])
+                    futures[future] = (res, satellite, neighbor)
+                else:
+                    failed.append((res, satellite, neighbor))
+
+            with tqdm(total=len(futures), desc='Building blending masks...') as pbar:
+                for future in as_completed(futures):
+                    res, satellite, neighbor = futures[future]
+
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f'Failed to generate {res} blending mask for {satellite} and {neighbor} overlap.')
+                        print(e)
+                        failed.append((res, satellite, neighbor))
+
+                    pbar.update(1)
+
+        return failed
+
+    #the mesh levels of detail only depend on which part of the sphere each satellite sees, so they are
+    #generated once, from the finest resolution's geometry. The viewer only draws them without the shader
+    #projection, with it the levels are generated when a satellite is loaded
+    def build_mesh_lods(self, subdivisions : tuple=(2, 3, 4, 5, 7)) -> None:
+        res = self.resolutions[-1]
+        geometry = self._build_geometry([(res, satellite) for satellite in self.neighboring_satellites])
+
+        for (res, satellite), data in tqdm(geometry.items(), desc='Generating mesh levels of detail...'):
+            try:
+                data.save_lod(subdivisions)
+            except Exception as e:
+                print(f'Failed to generate the mesh levels of detail for {satellite}.')
+                print(e)
+
+#each process already builds a mask in parallel with the others, so the rasterizer runs single threaded
+def _build_pair_mask(data : TiffImage, neighbor_data : TiffImage) -> None:
+    ImageBlender(data.satellite, neighbor_data.satellite, data.resolution, out_of_core=True,
+                 images=(data, neighbor_data), workers=1)
+
+if __name__ == '__main__':
+    from src.diagnostics import neighboring_satellites
+
+    asset_builder = AssetBuilder(neighboring_satellites, ['low_res', 'medium_res', 'high_res'])
+    asset_builder.build()
+    asset_builder.build_mesh_lods()
@@ -0,0 +1,119 @@
+from OpenGL.GL import *
+
+from src.shaders import Shader
+
+#Blends the overlapping satellites on the GPU. Every satellite is drawn into a floating point framebuffer
+#with additive blending, adding its color multiplied by a viewing zenith weight and its limb fade. The
+#resolve pass divides by the summed weights and draws the result over the scene with the fade as alpha.
+#this replaces the blending masks and alpha masks that are otherwise baked into the images
+class BlendAccumulator():
+    shader_kwargs = [{'type': GL_VERTEX_SHADER, 'filepath': 'shaders/resolve_vertex.glsl'},
+                    {'type': GL_FRAGMENT_SHADER, 'filepath': 'shaders/resolve_fragment.glsl'}]
+
+    def __init__(self) -> None:
+        self.shaders = Shader(self.shader_kwargs)
+        self.loaded = False
+        self.fbo = None
+        self.textures = []
+        self.vao = None
+        self.width = 0
+        self.height = 0
+        self.previous_fbo = 0
+
+    def _allocate(self, width : int, height : int) -> None:
+        self._delete_framebuffer()
+
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+
+        #(color * weight, weight) and the limb fade
+        for attachment, internal_format, format in [(GL_COLOR_ATTACHMENT0, GL_RGBA16F, GL_RGBA),
+                                                    (GL_COLOR_ATTACHMENT1, GL_R16F, GL_RED)]:
+            texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, format, GL_FLOAT, None)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glFramebufferTexture2D(GL_FRAMEBUFFER, attachment, GL_TEXTURE_2D, texture, 0)
+            self.textures.append(texture)
+
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        if (glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE):
+            print('The blending framebuffer is incomplete.')
+
+        self.width, self.height = width, height
+
+    #start accumulating into the blending framebuffer. The globe meshes are generated icospheres with a
+    #known winding, so back faces can be culled instead of depth tested
+    def begin(self, width : int, height : int) -> None:
+        if (not self.loaded):
+            self.shaders.load()
+            #the resolve triangle has no vertex data, but a vertex array still has to be bound
+            self.vao = glGenVertexArrays(1)
+            self.loaded = True
+
+        self.previous_fbo = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+
+        if (self.fbo is None or (width, height) != (self.width, self.height)):
+            self._allocate(width, height)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glDrawBuffers(2, [GL_COLOR_ATTACHMENT0, GL_COLOR_ATTACHMENT1])
+        glClearBufferfv(GL_COLOR, 0, [0.0, 0.0, 0.0, 0.0])
+        glClearBufferfv(GL_COLOR, 1, [0.0, 0.0, 0.0, 0.0])
+
+        glDisable(GL_DEPTH_TEST)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_ONE, GL_ONE)
+        glEnable(GL_CULL_FACE)
+        glCullFace(GL_BACK)
+        glFrontFace(GL_CCW)
+
+    def end(self) -> None:
+        glBindFramebuffer(GL_FRAMEBUFFER, self.previous_fbo)
+        glDisable(GL_CULL_FACE)
+        glDisable(GL_BLEND)
+        glEnable(GL_DEPTH_TEST)
+
+    #draw the blended satellites over the scene. Binds its own program
+    def resolve(self) -> None:
+        shader = self.shaders
+        glUseProgram(shader.program)
+        glUniform1i(shader.get_uniform_location("accumulation"), 0)
+        glUniform1i(shader.get_uniform_location("coverage"), 1)
+
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, self.textures[0])
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, self.textures[1])
+
+        glDisable(GL_DEPTH_TEST)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        glBindVertexArray(self.vao)
+        glDrawArrays(GL_TRIANGLES, 0, 3)
+        glBindVertexArray(0)
+
+        glDisable(GL_BLEND)
+        glEnable(GL_DEPTH_TEST)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glUseProgram(0)
+
+    def _delete_framebuffer(self) -> None:
+        if (self.fbo is not None):
+            glDeleteFramebuffers(1, self.fbo)
+            [glDeleteTextures(1, texture) for texture in self.textures]
+
+        self.fbo = None
+        self.textures = []
+
+    def delete(self) -> None:
+        self._delete_framebuffer()
+
+        if (self.vao is not None):
+            glDeleteVertexArrays(1, self.vao)
+            self.vao = None
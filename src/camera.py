@@ -29,12 +29,12 @@ class Camera():
         self.yaw = 0.0
 
 
-    def set_uniforms(self, program) -> None:
-        #camera projection and view
-        matrix = [x for y in self._get_projection() for x in y]
-        glUniformMatrix4fv(glGetUniformLocation(program, "projection"), 1, GL_FALSE, matrix)
-        matrix = [x for y in self._get_view() for x in y]
-        glUniformMatrix4fv(glGetUniformLocation(program, "view"), 1, GL_FALSE, matrix)
+    #upload the camera projection and view, once per frame. The matrices are passed straight from
+    #glm's memory, which is column major like OpenGL expects
+    def set_uniforms(self, shader) -> None:
+        glUniformMatrix4fv(shader.get_uniform_location("projection"), 1, GL_FALSE, glm.value_ptr(self._get_projection()))
+        glUniformMatrix4fv(shader.get_uniform_location("view"), 1, GL_FALSE, glm.value_ptr(self._get_view()))
+        glUniform3f(shader.get_uniform_location("viewDirection"), self.forward.x, self.forward.y, self.forward.z)
 
     #rotate the camera around the origin
     def rotate_origin(self, delta_x, delta_y):
@@ -82,6 +82,18 @@ class Camera():
         self.ortho_width = 1.0 / self.zoom_factor
         self.ortho_height = (self.ortho_width / self.aspect)
 
+    #row major numpy copy of the view matrix, used for culling on the CPU
+    def get_view_matrix(self) -> np.ndarray:
+        return np.array(self._get_view().to_list(), dtype=np.float64).T
+
+    #half the width and height of the orthographic view volume
+    def get_view_extent(self) -> tuple:
+        return self.ortho_width / 2.0, self.ortho_height / 2.0
+
+    #how many screen pixels one world unit covers for a viewport of the given height
+    def get_pixels_per_unit(self, viewport_height : int) -> float:
+        return viewport_height / self.ortho_height
+
     def _get_view(self) -> glm.mat4:
         return glm.lookAt(self.position, self.position + self.forward, self.up)
     
@@ -6,6 +6,8 @@ import satpy.modifiers.filters
 import satpy.composites.cloud_products
 import satpy.composites.spectral
 
+from src.composite_recipes import CompositeRecipe, sensor_bands, shader_recipes
+
 #ingest a satpy composites.yaml file and return a list of required channels for each composite
 class CompositeHelper():
     def __init__(self, yaml_file):
@@ -17,6 +19,9 @@ class CompositeHelper():
         with open(visir_path) as file:
             self.visir_composites = yaml.load(file, Loader=yaml.FullLoader)
 
+        #sensor_name looks like 'visir/abi'
+        self.sensor = self.composites.get('sensor_name', '').split('/')[-1]
+
     def get_composite_channels(self, composite_name):
         prerequisites = self._get_composite_prerequisites(composite_name)
 
@@ -38,6 +43,20 @@ class CompositeHelper():
     def get_available_composites(self):
         return [i for i in self.composites['composites'].keys()]
 
+    #composites that the viewer can compute from raw band textures, see composite_recipes.py
+    def is_shader_evaluable(self, composite_name):
+        return CompositeRecipe.get(composite_name) is not None and self.sensor in sensor_bands
+
+    def get_shader_composites(self):
+        return [name for name in shader_recipes if self.is_shader_evaluable(name)]
+
+    #the raw bands that have to be processed to evaluate the composite in the shader
+    def get_shader_bands(self, composite_name):
+        if not self.is_shader_evaluable(composite_name):
+            return None
+
+        return CompositeRecipe.get(composite_name).get_bands(self.sensor)
+
     def _get_composite_prerequisites(self, composite_name):
         names = []
         composite = None        
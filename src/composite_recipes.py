@@ -0,0 +1,133 @@
+from OpenGL.GL import *
+
+import numpy as np
+import os
+from PIL import Image
+
+#Composites that can be evaluated in the fragment shader from raw band textures. Processing saves every
+#band once per timestamp as an 8 bit image, and the viewer packs the (up to four) bands of a recipe into the
+#channels of one RGBA texture. A recipe combines the bands linearly for each output channel, then stretches
+#the result between a min and max value and applies a gamma, like satpy's enhancements do.
+
+satellite_sensors = {'goes_east' : 'abi', 'goes_west' : 'abi', 'himawari' : 'ahi',
+                     'meteosat_9' : 'seviri', 'meteosat_10' : 'seviri'}
+
+#the band of each sensor for every role used by the recipes
+sensor_bands = {
+    'abi' : {'wv62': 'C08', 'wv73': 'C10', 'ir97': 'C12', 'ir108': 'C13', 'ir120': 'C15', 'ir87': 'C11',
+             'ir39': 'C07', 'nir16': 'C05', 'vis08': 'C03', 'vis06': 'C02'},
+    'ahi' : {'wv62': 'B08', 'wv73': 'B10', 'ir97': 'B12', 'ir108': 'B13', 'ir120': 'B15', 'ir87': 'B11',
+             'ir39': 'B07', 'nir16': 'B05', 'vis08': 'B04', 'vis06': 'B03'},
+    'seviri' : {'wv62': 'WV_062', 'wv73': 'WV_073', 'ir97': 'IR_097', 'ir108': 'IR_108', 'ir120': 'IR_120',
+                'ir87': 'IR_087', 'ir39': 'IR_039', 'nir16': 'IR_016', 'vis08': 'VIS008', 'vis06': 'VIS006'},
+}
+
+class CompositeRecipe():
+    #channels holds one {role: coefficient} dict for each of the red, green and blue outputs
+    def __init__(self, name : str, channels : list, ranges : list, gamma : tuple=(1.0, 1.0, 1.0)) -> None:
+        self.name = name
+        self.channels = channels
+        self.ranges = ranges
+        self.gamma = gamma
+        #the roles in the order they are packed into the texture channels
+        self.roles = list(dict.fromkeys(role for channel in channels for role in channel))
+
+        if (len(self.roles) > 4):
+            raise ValueError(f'The {name} recipe needs more than four bands.')
+
+    #returns the recipe of a composite, or None if it can't be evaluated in the shader
+    def get(name : str):
+        return shader_recipes.get(name)
+
+    def get_bands(self, sensor : str) -> list:
+        return [sensor_bands[sensor][role] for role in self.roles]
+
+    #the rows of the matrix are the output channels, the columns the packed bands
+    def get_matrix(self) -> np.ndarray:
+        matrix = np.zeros((4, 4), dtype=np.float32)
+
+        for i, channel in enumerate(self.channels):
+            for role, coefficient in channel.items():
+                matrix[i, self.roles.index(role)] = coefficient
+
+        return matrix
+
+    def set_uniforms(self, shader) -> None:
+        scales = np.zeros(4, dtype=np.float32)
+        offsets = np.zeros(4, dtype=np.float32)
+
+        for i, role in enumerate(self.roles):
+            scales[i], offsets[i] = BandEncoding.get_decoding(BandEncoding.get_calibration(role))
+
+        #the matrix is row major, so OpenGL has to transpose it
+        glUniformMatrix4fv(shader.get_uniform_location("recipeMatrix"), 1, GL_TRUE, self.get_matrix())
+        glUniform4f(shader.get_uniform_location("recipeBandScale"), *scales)
+        glUniform4f(shader.get_uniform_location("recipeBandOffset"), *offsets)
+        glUniform3f(shader.get_uniform_location("recipeMin"), *[low for low, high in self.ranges])
+        glUniform3f(shader.get_uniform_location("recipeMax"), *[high for low, high in self.ranges])
+        glUniform3f(shader.get_uniform_location("recipeGamma"), *self.gamma)
+        glUniform1i(shader.get_uniform_location("recipeBands"), len(self.roles))
+
+    #band files are named {satellite}_band_{band}_{timestamp}.png
+    def is_band_file(file : str) -> bool:
+        return '_band_' in os.path.basename(file)
+
+    #returns {timestamp: {band: file}}
+    def group_band_files(files : list) -> dict:
+        groups = {}
+
+        for file in files:
+            name = os.path.basename(file).split('_band_')[1].split('.')[0]
+            band, date, time = name.rsplit('_', 2)
+            groups.setdefault(f'{date}_{time}', {})[band] = file
+
+        return groups
+
+#the range of physical values stored in the 8 bit band images. 0 marks pixels without data
+band_encodings = {'reflectance': (0.0, 120.0), 'brightness_temperature': (180.0, 330.0)}
+
+class BandEncoding():
+    def get_calibration(role : str) -> str:
+        if (role.startswith('vis') or role.startswith('nir')):
+            return 'reflectance'
+
+        return 'brightness_temperature'
+
+    def encode(values : np.ndarray, calibration : str) -> np.ndarray:
+        low, high = band_encodings[calibration]
+        encoded = 1.0 + np.clip((values - low) / (high - low), 0.0, 1.0) * 254.0
+
+        return np.where(np.isfinite(values), np.round(encoded), 0).astype(np.uint8)
+
+    #(scale, offset) that turn a normalized texture value back into the physical value
+    def get_decoding(calibration : str) -> tuple:
+        low, high = band_encodings[calibration]
+        step = (high - low) / 254.0
+
+        return 255.0 * step, low - step
+
+    #pack the band images of one timestamp into the channels of an RGBA image
+    def merge(files : tuple) -> Image.Image:
+        bands = []
+
+        #convert loads the pixels into a new image, so the files can be closed right away
+        for file in files:
+            with Image.open(file) as band:
+                bands.append(band.convert('L'))
+
+        bands += [Image.new('L', bands[0].size, 0) for i in range(4 - len(bands))]
+
+        return Image.merge('RGBA', bands)
+
+shader_recipes = {
+    'airmass' : CompositeRecipe('airmass', [{'wv62': 1.0, 'wv73': -1.0}, {'ir97': 1.0, 'ir108': -1.0}, {'wv62': 1.0}],
+                                [(-25.0, 0.0), (-40.0, 5.0), (243.9, 208.5)]),
+    'dust' : CompositeRecipe('dust', [{'ir120': 1.0, 'ir108': -1.0}, {'ir108': 1.0, 'ir87': -1.0}, {'ir108': 1.0}],
+                             [(-4.0, 2.0), (0.0, 15.0), (261.0, 289.0)], (1.0, 2.5, 1.0)),
+    'ash' : CompositeRecipe('ash', [{'ir120': 1.0, 'ir108': -1.0}, {'ir108': 1.0, 'ir87': -1.0}, {'ir108': 1.0}],
+                            [(-4.0, 2.0), (-4.0, 5.0), (243.0, 303.0)]),
+    'night_microphysics' : CompositeRecipe('night_microphysics', [{'ir120': 1.0, 'ir108': -1.0}, {'ir108': 1.0, 'ir39': -1.0}, {'ir108': 1.0}],
+                                           [(-4.0, 2.0), (0.0, 10.0), (243.0, 293.0)]),
+    'natural_color_raw' : CompositeRecipe('natural_color_raw', [{'nir16': 1.0}, {'vis08': 1.0}, {'vis06': 1.0}],
+                                          [(0.0, 120.0), (0.0, 120.0), (0.0, 120.0)], (1.8, 1.8, 1.8)),
+}
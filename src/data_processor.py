@@ -15,6 +15,9 @@ from datetime import timedelta
 
 from tqdm import tqdm
 
+from src.composite_recipes import CompositeRecipe, BandEncoding, satellite_sensors
+from src.tile_pyramid import PyramidBuilder
+
 class ImageProcessor():
     def __init__(self, project_folder) -> None:
         config.set(config_path=['satpy_configs/'])        
@@ -25,14 +28,28 @@ class ImageProcessor():
         self.satellites = [i for i in composites.keys()]
         self.composites = composites
 
-    def specify_image_params(self, resolution : str, apply_blending=False) -> None:
+    #raw_frames skips the alpha masks and blending, for viewers that blend the satellites on the GPU
+    #with band_textures, composites that the viewer can evaluate in the shader are saved as their raw bands.
+    #with tile_pyramids, a tile pyramid is built for every new raw frame so the viewer can stream it by zoom
+    def specify_image_params(self, resolution : str, apply_blending=False, raw_frames=False, band_textures=False,
+                             tile_pyramids=False) -> None:
         self.resolution = resolution
         self.apply_blending = apply_blending
+        self.raw_frames = raw_frames
+        self.band_textures = band_textures
+        self.tile_pyramids = tile_pyramids
 
     def process_images(self):
         for satellite in self.satellites:
             self.generate_images_from_data(satellite, 'png')
 
+        if (self.raw_frames):
+            if (self.tile_pyramids):
+                self._build_pyramids()
+
+            print('Done!')
+            return
+
         self._apply_alpha_masks() #apply the alpha masks to the images
 
         if (self.apply_blending):
@@ -40,6 +57,17 @@ class ImageProcessor():
 
         print('Done!')
     
+    def _build_pyramids(self) -> None:
+        builder = PyramidBuilder()
+
+        for satellite in self.satellites:
+            for file in tqdm(self.filenames.get(satellite, []), desc=f'Building {satellite} tile pyramids...'):
+                try:
+                    builder.build(file)
+                except Exception as e:
+                    print(f'Failed to build the tile pyramid of {file}.')
+                    print(e)
+
     def _get_satpy_kwargs(self, satellite : str) -> dict:
         if (satellite == 'himawari'):
             mode = 'native'
@@ -106,6 +134,15 @@ class ImageProcessor():
         kwargs = {'mode': mode, 'reader': reader, 'resample_area': resample_area}
 
         return kwargs
+
+    #returns the area definition that the images of a satellite are resampled to at the current resolution
+    def get_area_definition(self, satellite : str):
+        resample_area = self._get_satpy_kwargs(satellite)['resample_area']
+
+        if isinstance(resample_area, str):
+            resample_area = get_area_def(resample_area)
+
+        return resample_area
     
     #get timestamps for images for a given satellite
     def _find_image_timestamps(self, satellite : str) -> list:
@@ -158,7 +195,7 @@ class ImageProcessor():
             output_file_name = self.project_folder + f'images/{satellite}/{self.resolution}/{satellite}'
 
             kwargs = self._get_satpy_kwargs(satellite)
-            composites = self.composites[satellite]
+            composites, bands = self._get_band_composites(satellite)
 
             time_ordered_files = self._find_image_timestamps(satellite)
 
@@ -172,12 +209,18 @@ class ImageProcessor():
 
                     for composite in composites:
                         scn.load([composite], generate=False, upper_right_corner='NE')
+
+                    if (bands):
+                        scn.load(bands, upper_right_corner='NE')
                 
                     if (kwargs['resample_area'] == 'none'):
                         kwargs['resample_area'] = scn.coarsest_area()
                     
                     resampled_scn = scn.resample(kwargs['resample_area'], resampler=kwargs['mode'], reduce_data=False)
 
+                    for band in bands:
+                        self._save_band(resampled_scn, band, output_file_name)
+
                     for composite in composites:
                         timestamp = resampled_scn[composite].attrs['start_time'].strftime('%Y%m%d_%H%M')
                         
@@ -195,6 +238,36 @@ class ImageProcessor():
 
                     pbar.update(1)
 
+    #returns the composites that still need a satpy run, and the raw bands of the shader evaluable ones.
+    #bands shared by several composites are only saved once
+    def _get_band_composites(self, satellite : str) -> tuple:
+        composites = self.composites[satellite]
+
+        if (not self.band_textures or satellite not in satellite_sensors):
+            return composites, []
+
+        sensor = satellite_sensors[satellite]
+        recipes = [CompositeRecipe.get(composite) for composite in composites]
+        bands = [band for recipe in recipes if recipe is not None for band in recipe.get_bands(sensor)]
+
+        return [composite for composite, recipe in zip(composites, recipes) if recipe is None], list(dict.fromkeys(bands))
+
+    #bands are saved as 8 bit images of their calibrated values, see BandEncoding
+    def _save_band(self, scn, band : str, output_file_name : str) -> None:
+        timestamp = scn[band].attrs['start_time'].strftime('%Y%m%d_%H%M')
+        filename = output_file_name + f'_band_{band}_{timestamp}.png'
+
+        if (glob(filename)):
+            print(f'{filename} already exists')
+            return
+
+        try:
+            calibration = scn[band].attrs.get('calibration', 'brightness_temperature')
+            Image.fromarray(BandEncoding.encode(scn[band].values, calibration)).save(filename)
+        except Exception as e:
+            print(f'failed to save {filename}')
+            print(e)
+
     #this method generates only a scene from the files detected.
     def _generate_scene_from_data(self, satellite : str) -> None:
         with dask.config.set({"array.chunk-size" : "12MiB"}):
@@ -261,8 +334,8 @@ class ImageProcessor():
         neighboring_satellites = self._get_neighboring_satellites(satellite)
         my_files = glob(self.project_folder + f'images/{satellite}/{self.resolution}/{satellite}*.png')
 
-        #remove any files that have already been blended
-        my_files = [i for i in my_files if 'blended' not in i]
+        #remove any files that have already been blended, and the raw bands
+        my_files = [i for i in my_files if 'blended' not in i and '_band_' not in i]
 
         image_pairs = []
 
@@ -0,0 +1,71 @@
+import numpy as np
+import os
+import json
+import threading
+
+#An optional on disk cache of decoded frames. The first decode of an image also writes its RGBA pixels as a
+#.npy file to a .decoded folder next to it, and later loads memory map that file instead of inflating the
+#PNG again, so they are bound by disk bandwidth. Each entry stores the modification time and size of its
+#source files and is only used while they match. Tiles are uploaded from the whole frame with unpack
+#offsets, so the frames are stored untiled.
+#decoded frames are several times larger than the PNGs, which is why the cache is disabled by default
+class DecodedCache():
+    def __init__(self, enabled : bool=False) -> None:
+        self.enabled = enabled
+
+    #file is an image file, or a tuple of band files packed into one frame
+    def _get_paths(self, file) -> tuple:
+        files = file if isinstance(file, tuple) else (file,)
+        folder = os.path.join(os.path.dirname(os.path.abspath(files[0])), '.decoded')
+        name = '+'.join(os.path.basename(f) for f in files)
+
+        return os.path.join(folder, name + '.npy'), os.path.join(folder, name + '.json')
+
+    def _get_source_info(file) -> list:
+        files = file if isinstance(file, tuple) else (file,)
+
+        return [[os.path.getmtime(f), os.path.getsize(f)] for f in files]
+
+    #returns the memory mapped frame, or None if it isn't cached or its source files changed
+    def load(self, file):
+        if (not self.enabled):
+            return None
+
+        data_path, info_path = self._get_paths(file)
+
+        try:
+            with open(info_path, 'r') as f:
+                info = json.load(f)
+
+            if (info['sources'] != DecodedCache._get_source_info(file)):
+                return None
+
+            return np.load(data_path, mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return None
+
+    #the files are written under a temporary name and renamed, so a partially written entry is never used
+    def save(self, file, image : np.ndarray) -> None:
+        if (not self.enabled):
+            return
+
+        data_path, info_path = self._get_paths(file)
+        #several decoder threads can write the same entry at once
+        suffix = f'.{os.getpid()}.{threading.get_ident()}.partial'
+
+        try:
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+            with open(data_path + suffix, 'wb') as f:
+                np.save(f, image)
+
+            with open(info_path + suffix, 'w') as f:
+                json.dump({'sources': DecodedCache._get_source_info(file), 'shape': list(image.shape)}, f)
+
+            os.replace(data_path + suffix, data_path)
+            os.replace(info_path + suffix, info_path)
+        except OSError as e:
+            print(f'Failed to cache the decoded frame of {file}.')
+            print(e)
+
+decoded_cache = DecodedCache()
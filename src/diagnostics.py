@@ -3,7 +3,7 @@ from glob import glob
 
 from src.download_manager import DownloadManager
 from src.data_processor import ImageProcessor
-from src.image_handler import ImageBlender
+from src.asset_builder import AssetBuilder
 
 from datetime import datetime, timezone
 import numpy as np
@@ -113,44 +113,19 @@ class AppDiagnostics():
                         print(f'Failed to generate alpha mask for {name}.')
 
 
+    #blending masks only depend on the geometry of each satellite's image, so they are generated from
+    #the area definitions alone without downloading data or rendering tif images. All missing masks
+    #are built in one parallel job
     def _attempt_fix_blending_masks(self, resolution):
         if len(self.missing_blending_mask_files) > 0:
-            for res, satellite, neighbor in self.missing_blending_mask_files:
-                if res in resolution:
-                    mask_name = f'{satellite}_{neighbor}.npy'
-
-                    print(f'Attempting to generate {res} {mask_name}.')
+            missing = [i for i in self.missing_blending_mask_files if i[0] in resolution]
+            resolutions = list(dict.fromkeys([i[0] for i in missing]))
 
-                    #generate the directory
-                    os.makedirs(f'data/{satellite}/', exist_ok=True)
+            for res, satellite, neighbor in missing:
+                print(f'Attempting to generate {res} {satellite}_{neighbor}.npy.')
 
-                    #download a small amount of image data
-                    download_manager = DownloadManager([satellite, neighbor])
-                    download_manager.specify_channels([self.channels[neighbor], self.channels[neighbor]])
-                    download_manager.specify_start_end(datetime(2023, 1, 1, 0, 0, tzinfo=timezone.utc), datetime(2023, 1, 1, 0, 10, tzinfo=timezone.utc), 1)
-
-                    image_processor = ImageProcessor('')
-                    composites = {satellite : self.channels[satellite], neighbor : self.channels[neighbor]}
-                    image_processor.add_satellites(composites)
-                    image_processor.specify_image_params(res)
-
-                    try:
-                        download_manager.download_data('')
-                    except Exception as e:
-                        print(f'Failed to download data.')
-                        print(e)                            
-                    
-                    try:
-                        image_processor.generate_images_from_data(satellite, 'tif')
-                        image_processor.generate_images_from_data(neighbor, 'tif')
-                    except Exception as e:
-                        print(f'Failed to generate tif image for {satellite} or {neighbor}.')
-                        print(e)
-                    
-                    try:
-                        ImageBlender(satellite, neighbor, res)
-                    except Exception as e:
-                        print(f'Failed to generate blending mask for {satellite} and {neighbor} overlap.')
+            asset_builder = AssetBuilder(neighboring_satellites, resolutions)
+            asset_builder.build(missing)
 
 if __name__ == '__main__':
     app_diagnostics = AppDiagnostics(attempt_fix=True, resolutions=['low_res', 'medium_res', 'high_res'])
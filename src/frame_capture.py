@@ -0,0 +1,134 @@
+from OpenGL.GL import *
+
+import numpy as np
+import ctypes
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+#Captures rendered frames without stalling on the GPU or on PNG compression. glReadPixels goes into one of
+#a few pixel pack buffers, so it returns as soon as the copy is queued and the next frame can be drawn. A
+#buffer is only mapped once its fence says the copy finished, usually a frame or two later. The pixels are
+#then handed to a pool of writer threads that flip and encode them (zlib releases the GIL, so the encodes
+#run in parallel with each other and with the rendering). Frames can also go to a VideoExport, which encodes
+#them in capture order on its own thread
+class FrameCapture():
+    def __init__(self, num_pbos : int=3, workers : int=None) -> None:
+        self.num_pbos = num_pbos
+        self.pbos = None
+        self.pbo_index = 0
+        self.size = None
+
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='frame-writer')
+        #at most this many frames wait for a writer, so a slow disk can't fill the memory
+        self.max_queued = self.workers * 2
+
+        self.readbacks = deque()    #(pbo, fence, width, height, output) in capture order
+        self.writes = deque()       #futures of the frames being written
+
+    def _allocate(self, width : int, height : int) -> None:
+        self._delete_buffers()
+        self.pbos = [glGenBuffers(1) for i in range(self.num_pbos)]
+
+        for pbo in self.pbos:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, width * height * 4, None, GL_STREAM_READ)
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.size = (width, height)
+
+    #queue a copy of the current read framebuffer, once it reaches the CPU it is saved to output (a PNG file
+    #name) or written to it (a VideoExport). Must be called with the GL context current
+    def capture(self, width : int, height : int, output) -> None:
+        if (self.size != (width, height)):
+            self.finish()
+            self._allocate(width, height)
+
+        #every buffer holds a frame that hasn't been read yet
+        if (len(self.readbacks) == self.num_pbos):
+            self._collect(True)
+
+        pbo = self.pbos[self.pbo_index]
+        self.pbo_index = (self.pbo_index + 1) % self.num_pbos
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        #with a pixel pack buffer bound, the pixel pointer is an offset into the buffer
+        glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glPixelStorei(GL_PACK_ALIGNMENT, 4)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        self.readbacks.append((pbo, glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0), width, height, output))
+
+        #hand over the frames that already arrived
+        while (self.readbacks and self._collect(False)):
+            pass
+
+    #map the oldest readback and queue it for writing. Without wait, returns False if the copy isn't done yet
+    def _collect(self, wait : bool) -> bool:
+        pbo, fence, width, height, output = self.readbacks[0]
+        timeout = 1000000000 if wait else 0 #nanoseconds
+
+        while (True):
+            status = glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, timeout)
+
+            if (status != GL_TIMEOUT_EXPIRED or not wait):
+                break
+
+        if (status == GL_TIMEOUT_EXPIRED):
+            return False
+
+        self.readbacks.popleft()
+        glDeleteSync(fence)
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        pointer = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, width * height * 4, GL_MAP_READ_BIT)
+        mapped = np.ctypeslib.as_array(ctypes.cast(pointer, ctypes.POINTER(ctypes.c_uint8)), shape=(height, width, 4))
+        #the buffer is reused for a later frame, so the writer gets its own copy
+        pixels = mapped.copy()
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        if (not isinstance(output, str)):
+            output.write(pixels)
+            return True
+
+        while (len(self.writes) >= self.max_queued):
+            FrameCapture._check_write(self.writes.popleft())
+
+        self.writes.append(self.executor.submit(FrameCapture._write, pixels, output))
+
+        return True
+
+    #OpenGL's first row is the bottom of the image, the flip is a view that PIL copies while encoding
+    def _write(pixels : np.ndarray, file : str) -> None:
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        Image.fromarray(pixels[::-1]).save(file)
+
+    def _check_write(future) -> None:
+        try:
+            future.result()
+        except Exception as e:
+            print('Failed to save a captured frame.')
+            print(e)
+
+    #wait until every captured frame has been written
+    def finish(self) -> None:
+        while (self.readbacks):
+            self._collect(True)
+
+        while (self.writes):
+            FrameCapture._check_write(self.writes.popleft())
+
+    def _delete_buffers(self) -> None:
+        if (self.pbos is not None):
+            [glDeleteBuffers(1, pbo) for pbo in self.pbos]
+
+        self.pbos = None
+        self.size = None
+
+    def delete(self) -> None:
+        self.finish()
+        self._delete_buffers()
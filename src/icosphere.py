@@ -0,0 +1,46 @@
+import numpy as np
+
+#generates icospheres programmatically, so mesh levels of any subdivision can be built without a model
+#file. Every subdivision splits each triangle into four and pushes the new vertices onto the sphere.
+#the triangles are counter clockwise when seen from outside of the sphere
+class Icosphere():
+    def create(subdivisions : int, radius : float=1.0) -> tuple:
+        vertices, faces = Icosphere._icosahedron()
+
+        for i in range(subdivisions):
+            vertices, faces = Icosphere._subdivide(vertices, faces)
+
+        return (vertices * radius).astype(np.float32), faces.flatten().astype(np.uint32)
+
+    def _icosahedron() -> tuple:
+        t = (1.0 + np.sqrt(5.0)) / 2.0
+
+        vertices = np.array([[-1, t, 0], [1, t, 0], [-1, -t, 0], [1, -t, 0],
+                             [0, -1, t], [0, 1, t], [0, -1, -t], [0, 1, -t],
+                             [t, 0, -1], [t, 0, 1], [-t, 0, -1], [-t, 0, 1]], dtype=np.float64)
+        vertices /= np.linalg.norm(vertices, axis=1)[:, np.newaxis]
+
+        faces = np.array([[0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11],
+                          [1, 5, 9], [5, 11, 4], [11, 10, 2], [10, 7, 6], [7, 1, 8],
+                          [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8], [3, 8, 9],
+                          [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]], dtype=np.int64)
+
+        return vertices, faces
+
+    #every edge is shared by two triangles, so the midpoints are generated once per unique edge
+    def _subdivide(vertices : np.ndarray, faces : np.ndarray) -> tuple:
+        edges = np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]))
+        unique_edges, inverse = np.unique(np.sort(edges, axis=1), axis=0, return_inverse=True)
+
+        midpoints = vertices[unique_edges].mean(axis=1)
+        midpoints /= np.linalg.norm(midpoints, axis=1)[:, np.newaxis]
+
+        #(faces, 3) indices of the midpoints of the edges ab, bc and ca
+        mid = inverse.reshape(3, -1).T + len(vertices)
+        a, b, c = faces[:, 0], faces[:, 1], faces[:, 2]
+        ab, bc, ca = mid[:, 0], mid[:, 1], mid[:, 2]
+
+        faces = np.concatenate((np.column_stack((a, ab, ca)), np.column_stack((b, bc, ab)),
+                                np.column_stack((c, ca, bc)), np.column_stack((ab, bc, ca))))
+
+        return np.concatenate((vertices, midpoints)), faces
@@ -1,44 +1,92 @@
 import numpy as np
-from math import sin, cos, pi, sqrt, atan2, asin
+import os
+from math import pi
 from glob import glob
 from PIL import Image
 Image.MAX_IMAGE_PIXELS = None  #avoid decompression bomb warning
 
 import rasterio
+from affine import Affine
 import pyproj
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 from scipy.spatial import Delaunay
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 
 from memory_profiler import profile
 
+from src.icosphere import Icosphere
+from src.triangle_rasterizer import TriangleRasterizer
+
 #use geolocated images to create texture and vertex coordinates for each satellite on the sphere
 class TiffImage():
-    def __init__(self, satellite : str, resolution : str):
+    def __init__(self, satellite : str, resolution : str, area_def=None):
         self.satellite = satellite
         self.resolution = resolution
-        self.file = glob(f'images/{satellite}/{resolution}/{satellite}*.tif')[0]
-        self._load_image()
+
+        #if an area definition is given, only the image geometry is needed and no tif file has to exist
+        if area_def is not None:
+            self.file = None
+            self._load_area_def(area_def)
+        else:
+            self.file = glob(f'images/{satellite}/{resolution}/{satellite}*.tif')[0]
+            self._load_image()
+
+        self._init_transformers()
+          
+        self._load_obj('models/ico_6div.obj')
+        self._initialize_vertex_lon_lat()
+        self._texcoord_lookup()
+
+    def _init_transformers(self):
         self.wgs84 = pyproj.Proj(proj='latlong', datum='WGS84')
         #lonlat transformer turns longitude/latitude coordinates into geostationary coordinates
         self.lonlat_transformer = pyproj.Transformer.from_proj(self.wgs84, self.projection, always_xy=True)
         #geos transformer turns geostationary coordinates into longitude/latitude coordinates
         self.geos_transformer = pyproj.Transformer.from_proj(self.projection, self.wgs84, always_xy=True)
-        self.rows, self.cols = self.image.shape
-          
-        self._load_obj('models/ico_6div.obj')
-        self._initialize_vertex_lon_lat()
-        self._texcoord_lookup()
 
+    #the pyproj objects are rebuilt from the projection's WKT so the image can be sent to worker processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        for key in ['wgs84', 'lonlat_transformer', 'geos_transformer', 'projection']:
+            state.pop(key, None)
+
+        state['projection_wkt'] = self.projection.crs.to_wkt()
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.projection = pyproj.Proj(pyproj.CRS.from_wkt(self.__dict__.pop('projection_wkt')))
+        self._init_transformers()
+
+    #only the georeferencing and the shape of the tif are used, so the pixels are never read
     def _load_image(self):
-        file = self.file
-        src = rasterio.open(file)
-        self.image = src.read(1)
-        self.image_arr = np.asarray(Image.open(file))
+        with rasterio.open(self.file) as src:
+            self.transform = src.transform
+            self.projection = pyproj.Proj(src.crs, datum='WGS84')
+            self.rows, self.cols = src.height, src.width
+
+    #build the same georeferencing from a pyresample area definition (the area the images are resampled to)
+    def _load_area_def(self, area_def):
+        x_min, _, _, y_max = area_def.area_extent
+        self.transform = Affine(area_def.pixel_size_x, 0.0, x_min, 0.0, -area_def.pixel_size_y, y_max)
+        self.projection = pyproj.Proj(area_def.crs, datum='WGS84')
+        self.rows, self.cols = area_def.height, area_def.width
+
+    #equivalent of rasterio's DatasetReader.index, vectorized over numpy arrays
+    def index(self, x, y) -> tuple:
+        col, row = ~self.transform * (np.asarray(x), np.asarray(y))
 
-        self.transform = src.transform
-        self.projection = pyproj.Proj(src.crs, datum='WGS84')
-        self.src = src
+        return np.floor(row).astype(np.int64), np.floor(col).astype(np.int64)
+
+    #equivalent of rasterio's DatasetReader.xy, returns the coordinates of the pixel centers
+    def xy(self, row, col) -> tuple:
+        x, y = self.transform * (np.asarray(col) + 0.5, np.asarray(row) + 0.5)
+
+        return x, y
 
     #loads the vertices and indices from an obj file
     def _load_obj(self, filepath) -> None:
@@ -59,29 +107,41 @@ class TiffImage():
         self.indices = np.array(indices, dtype=np.uint32) - np.ones(len(indices), dtype=np.uint32)
         self.length = len(self.indices)
 
+    #vertex ids are the vertex indices in the obj file. They stay attached to the vertices through any
+    #filtering, so images generated from the same model can be matched by id instead of by coordinates
     def _initialize_vertex_lon_lat(self):
-        vertex_lon_lat = []
-        for vertex in self.vertices:
-            lon, lat = self.world_to_latlon(vertex[0], vertex[1], vertex[2]) #make sure the radius is correct
-            vertex_lon_lat.append([lon, lat])
+        self.vertex_ids = np.arange(len(self.vertices), dtype=np.int64)
+        lon, lat = self.world_to_latlon(self.vertices[:, 0], self.vertices[:, 1], self.vertices[:, 2])
 
-        self.vertex_lon_lat = np.array(vertex_lon_lat)
+        self.vertex_lon_lat = np.column_stack((lon, lat))
 
+    #works on scalars as well as on arrays of coordinates
     def world_to_latlon(self, x, y, z):
-        R = sqrt(x**2 + y**2 + z**2)
+        x, y, z = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), np.asarray(z, dtype=np.float64)
+        R = np.sqrt(x**2 + y**2 + z**2)
         #convert coordinates on the sphere to longitude and latitude
-        lat = asin(z / R) 
-        lon = atan2(y, x)
+        lat = np.arcsin(z / R) 
+        lon = np.arctan2(y, x)
 
         #convert radians to degrees
-        lat = (lat * (180 / pi))
-        lon = lon * (180 / pi)
+        lat = np.degrees(lat)
+        lon = np.degrees(lon)
 
         return lon, lat
     
     def _texcoord_lookup(self):
+        valid_mask, tex_coords, geos_coords = self._lonlat_to_tex_coords(self.vertex_lon_lat[:, 0], self.vertex_lon_lat[:, 1])
+
+        self.vertices = self.vertices[valid_mask]
+        self.tex_coords = tex_coords
+        self.geos_coords = geos_coords
+        self.vertex_lon_lat = self.vertex_lon_lat[valid_mask]
+        self.vertex_ids = self.vertex_ids[valid_mask]
+
+    #returns the mask of the coordinates the satellite can see, and their texture and geostationary coordinates
+    def _lonlat_to_tex_coords(self, lon, lat) -> tuple:
         #convert lat lon from vertices to geostationary coordinates
-        x_geos, y_geos = self.lonlat_transformer.transform(self.vertex_lon_lat[:, 0], self.vertex_lon_lat[:, 1])
+        x_geos, y_geos = self.lonlat_transformer.transform(lon, lat)
 
         #remove invalid coordinates
         valid_mask_inf = ~np.logical_or(np.isinf(x_geos), np.isinf(y_geos))
@@ -90,24 +150,21 @@ class TiffImage():
 
         x_geos = x_geos[valid_mask]
         y_geos = y_geos[valid_mask]
-        self.vertices = self.vertices[valid_mask]
 
         #convert to pixel coordinates
-        row, col = self.src.index(x_geos, y_geos)
+        row, col = self.index(x_geos, y_geos)
         #normalize the coordinates
         row = np.array(row) / self.rows
         col = np.array(col) / self.cols
-        
-        self.tex_coords = np.column_stack((col, row))
-        self.geos_coords = np.column_stack((x_geos, y_geos))
-        self.vertex_lon_lat = self.vertex_lon_lat[valid_mask]
+
+        return valid_mask, np.column_stack((col, row)), np.column_stack((x_geos, y_geos))
 
     def _get_img_coords(self):
         print('Calculating image coordinates...')
         #get the geos coords of each pixel in the image
         x, y = np.meshgrid(np.arange(self.cols), np.arange(self.rows))
 
-        x_geos, y_geos = self.src.xy(x.ravel(), y.ravel())
+        x_geos, y_geos = self.xy(y.ravel(), x.ravel())
         combined_array = np.column_stack((x_geos, y_geos))
 
         return combined_array
@@ -121,17 +178,85 @@ class TiffImage():
     def save(self):
         np.save(f'data/texture_coords/{self.satellite}_tex_coords.npy', self.tex_coords.flatten().astype(np.float32))
         np.save(f'data/vertex_coords/{self.satellite}_vertex_coords.npy', self.vertices.flatten().astype(np.float32))
+        np.save(f'data/vertex_coords/{self.satellite}_vertex_ids.npy', self.vertex_ids)
+
+    #the mesh levels of detail are icospheres of different subdivisions, cut to the part of the sphere the
+    #satellite can see like the main mesh. Each level also stores its error: how far (in world units) the
+    #flat triangles and the linearly interpolated texture coordinates are from the true sphere and image
+    def save_lod(self, subdivisions : tuple=(2, 3, 4, 5, 7)) -> None:
+        os.makedirs('data/lod/', exist_ok=True)
+        radius = float(np.mean(np.linalg.norm(self.vertices, axis=1)))
+
+        for n in subdivisions:
+            vertices, indices = Icosphere.create(n, radius)
+            lon, lat = self.world_to_latlon(vertices[:, 0], vertices[:, 1], vertices[:, 2])
+            valid_mask, tex_coords, _ = self._lonlat_to_tex_coords(lon, lat)
+
+            #only keep the triangles with every vertex on the image
+            triangles = indices.reshape(-1, 3)
+            triangles = triangles[valid_mask[triangles].all(axis=1)]
+            remap = np.cumsum(valid_mask) - 1
+            vertices = vertices[valid_mask]
+            triangles = remap[triangles]
+
+            error = self._get_lod_error(vertices, triangles, tex_coords, radius)
+
+            np.save(f'data/lod/{self.satellite}_lod{n}_vertex_coords.npy', vertices.flatten().astype(np.float32))
+            np.save(f'data/lod/{self.satellite}_lod{n}_indices.npy', triangles.flatten().astype(np.uint32))
+            np.save(f'data/lod/{self.satellite}_lod{n}_tex_coords.npy', tex_coords.flatten().astype(np.float32))
+            np.save(f'data/lod/{self.satellite}_lod{n}_error.npy', np.array([error]))
+
+    #compares the middle of every edge with the point on the sphere above it. The texture error is how far the
+    #interpolated texture coordinate is from the true one, scaled to world units by the edge's texture stretch
+    def _get_lod_error(self, vertices : np.ndarray, triangles : np.ndarray, tex_coords : np.ndarray, radius : float) -> float:
+        edges = np.unique(np.sort(np.concatenate((triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]])), axis=1), axis=0)
+
+        chord_midpoints = vertices[edges].astype(np.float64).mean(axis=1)
+        sphere_midpoints = chord_midpoints / np.linalg.norm(chord_midpoints, axis=1)[:, np.newaxis] * radius
+        geometric_error = np.linalg.norm(sphere_midpoints - chord_midpoints, axis=1)
+
+        lon, lat = self.world_to_latlon(sphere_midpoints[:, 0], sphere_midpoints[:, 1], sphere_midpoints[:, 2])
+        valid_mask, true_tex_coords, _ = self._lonlat_to_tex_coords(lon, lat)
+        edges = edges[valid_mask]
+
+        interpolated = tex_coords[edges].mean(axis=1)
+        edge_tex_length = np.linalg.norm(tex_coords[edges[:, 0]] - tex_coords[edges[:, 1]], axis=1)
+        edge_length = np.linalg.norm(vertices[edges[:, 0]] - vertices[edges[:, 1]], axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            texture_error = np.linalg.norm(interpolated - true_tex_coords, axis=1) * edge_length / edge_tex_length
+
+        texture_error = np.minimum(np.nan_to_num(texture_error), edge_length)
+
+        #the outliers are a few triangles on the limb, where the screen foreshortens them anyway
+        return float(max(np.max(geometric_error), np.percentile(texture_error, 99)))
 
 
 #the following functions will define a novel method for blending the images together based
 #on the vertices that lie on each image.
 class ImageBlender():
-    def __init__(self, satellite1 : str, satellite2 : str, resolution : str) -> None:
+    #area_defs is an optional (area_def1, area_def2) tuple. When given, the blending mask is built from
+    #geometry alone and no tif images have to be downloaded or rendered first.
+    #with out_of_core=True each band of pixels is written straight into a memory-mapped .npy file as it
+    #completes, so peak memory does not depend on the image size.
+    #images is an optional (TiffImage, TiffImage) tuple of already generated geometry that is reused as is
+    def __init__(self, satellite1 : str, satellite2 : str, resolution : str, area_defs : tuple=None, out_of_core : bool=False,
+                 images : tuple=None, workers : int=None) -> None:
         self.satellite = satellite1
         self.resolution = resolution
         self.adjacent_satellite = satellite2
-        self.data = TiffImage(self.satellite, resolution)
-        self.neighbor_data = TiffImage(satellite2, resolution)
+        self.out_of_core = out_of_core
+        self.output_file = f'images/blending_masks/{resolution}/{satellite1}_{satellite2}.npy'
+        self.blending_image = None
+
+        if area_defs is None:
+            area_defs = (None, None)
+
+        if images is not None:
+            self.data, self.neighbor_data = images
+        else:
+            self.data = TiffImage(self.satellite, resolution, area_defs[0])
+            self.neighbor_data = TiffImage(satellite2, resolution, area_defs[1])
         
         #determine which vertices are shared between the images
         self._get_overlapping_vertices()
@@ -140,25 +265,26 @@ class ImageBlender():
         #and the two satellites
         self._get_vertex_weights() 
 
+        #the generated data is an image of shape (x, y, 3) where x and y are the dimensions of the 
+        #main image, (x, y, 0) is the pixel weight, (x, y, 1) is the x coordinate of the twin pixel, and
+        #(x, y, 2) is the y coordinate of the twin pixel. All blending information is stored in this image
+        if (self.out_of_core):
+            self._open_blending_image()
+
         #triangulate takes the vertex pixel coordinates and uses the pixel barycentric coordinates
         #for each triangle to determine the weight of each pixel in each triangle as well as the 
         #'twin' pixel location in the neighboring satellite image
-        self._triangulate()
+        self._triangulate(workers=workers)
 
-        #saves the generated data to an image of shape (x, y, 3) where x and y are the dimensions of the 
-        #main image, (x, y, 0) is the pixel weight, (x, y, 1) is the x coordinate of the twin pixel, and
-        #(x, y, 2) is the y coordinate of the twin pixel. All blending information is stored in this image
-        self._save_blending_image()
+        if (self.out_of_core):
+            self._close_blending_image()
+        else:
+            self._save_blending_image()
 
     def _get_overlapping_vertices(self) -> None:
-        my_tex_coords = []
-
-        vertex_lon_lats = self.data.vertex_lon_lat
-        n_verts = self.neighbor_data.vertex_lon_lat
-
-        n_mask = np.logical_and(np.isin(n_verts[:, 0], vertex_lon_lats[:, 0]),
-                                np.isin(n_verts[:, 1], vertex_lon_lats[:, 1]))
-        neighbor_vertices = n_verts[n_mask]
+        #both images are generated from the same model, so the shared vertices are the intersection of the vertex ids
+        _, _, n_idx = np.intersect1d(self.data.vertex_ids, self.neighbor_data.vertex_ids, assume_unique=True, return_indices=True)
+        neighbor_vertices = self.neighbor_data.vertex_lon_lat[n_idx]
 
         #convert vertex lon/lat to geostationary coordinates
         #get the geostationary coordinates of the vertices for the main image
@@ -167,8 +293,8 @@ class ImageBlender():
         n_geos_x, n_geos_y = self.neighbor_data.lonlat_transformer.transform(neighbor_vertices[:, 0], neighbor_vertices[:, 1])
 
         #convert geostationary coordinates to pixel coordinates for both images
-        my_tc_x, my_tc_y = self.data.src.index(my_geos_x, my_geos_y)
-        n_tc_x, n_tc_y = self.neighbor_data.src.index(n_geos_x, n_geos_y)
+        my_tc_x, my_tc_y = self.data.index(my_geos_x, my_geos_y)
+        n_tc_x, n_tc_y = self.neighbor_data.index(n_geos_x, n_geos_y)
 
         neighbor_tex_coords = np.column_stack((n_tc_x, n_tc_y))
         my_tex_coords = np.column_stack((my_tc_x, my_tc_y))
@@ -239,84 +365,86 @@ class ImageBlender():
 
         return np.array(abs(dlon) * r) #only return the longitudinal distance for now
 
-    #this function uses a lot of memory, so it may actually kill your computer for a moment if you have less
-    # than 16 GB of memory and you try to use it on high res (>11,000x11,000 px) images.
-    #I don't think it's a memory leak, it's just a lot of data.
-    def _triangulate(self):
-        tex_coords = self.vertex_coords
-        self.triangulation = Delaunay(tex_coords)
-        triangles = self.triangulation.simplices
-
-        n_pixel_coords = self.neighboring_tex_coords
-        weights = self.vertex_weights
-
-        triangle_pixels = []   #pixel coordinates for each triangle
-        n_triangle_pixels = [] #pixel coordinates for each triangle in the neighboring image
-        triangle_weights = []  #pixel weights for each triangle
-
-        with tqdm(total=len(triangles), desc='Triangulating...') as pbar:
-            for triangle in triangles:
-                pixels, n_pixels, pixel_weights = self.get_pixels_for_triangle(triangle, tex_coords, n_pixel_coords, weights)
-                
-                triangle_pixels.append(pixels)
-                n_triangle_pixels.append(n_pixels)
-                triangle_weights.append(pixel_weights)
-                
-                pbar.update(1)
-        
+    #rasterizes the triangulation in bands of pixels along the first image axis. Every pixel of a band is
+    #assigned to its simplex in one find_simplex call, and the weights and twin pixel coordinates are then
+    #interpolated with batched array operations. Bands are independent, so they are processed on a thread pool
+    #(qhull's point location runs without the GIL) and memory is bounded by the band size.
+    #In out of core mode finished bands are written into the memory-mapped blending image instead of being kept.
+    def _triangulate(self, band_pixels : int=2**20, workers : int=None):
+        #fewer than three shared vertices can't be triangulated, so the overlap has no pixels
+        if (len(self.vertex_coords) >= 3):
+            self.triangulation = Delaunay(self.vertex_coords)
+            bands = self._get_pixel_bands(band_pixels)
+        else:
+            bands = []
+
+        workers = workers or os.cpu_count() or 1
+
+        triangle_pixels = []   #pixel coordinates inside the triangulation
+        n_triangle_pixels = [] #twin pixel coordinates in the neighboring image
+        triangle_weights = []  #pixel weights
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            with tqdm(total=len(bands), desc='Triangulating...') as pbar:
+                #only a few bands are in flight at once so finished bands don't pile up in memory
+                pending = deque()
+
+                for band in bands:
+                    pending.append(executor.submit(self._rasterize_band, band))
+
+                    if (len(pending) >= 2 * workers):
+                        self._collect_band(pending.popleft().result(), triangle_pixels, n_triangle_pixels, triangle_weights)
+                        pbar.update(1)
+
+                while pending:
+                    self._collect_band(pending.popleft().result(), triangle_pixels, n_triangle_pixels, triangle_weights)
+                    pbar.update(1)
+
+        if (self.blending_image is not None):
+            return
+
+        #an overlap without any pixels in the image gives an empty (all zero) blending image
+        if (not triangle_pixels):
+            triangle_pixels = [np.empty((0, 2), dtype=np.int64)]
+            n_triangle_pixels = [np.empty((0, 2), dtype=np.int32)]
+            triangle_weights = [np.empty(0)]
+
         self.triangulated_pixels = np.concatenate(triangle_pixels)
         self.triangulated_n_pixels = np.concatenate(n_triangle_pixels)
         self.triangulated_weights = np.concatenate(triangle_weights)
 
-    def get_pixels_for_triangle(self, triangle, pixel_coords, n_pixel_coords, vertex_weights) -> list:
-        #get the vertices of the triangle
-        vertices = np.array([pixel_coords[triangle[i]] for i in range(3)]) #pixel locations of the vertices
-        n_vertices = np.array([n_pixel_coords[triangle[i]] for i in range(3)]) #pixel locations of the vertices in the neighboring image
-        weight_vals = np.array([vertex_weights[triangle[i]] for i in range(3)])
-
-        #calculate the bounding box of the triangle
-        min_x = int(np.min(vertices[:, 0]))
-        max_x = int(np.max(vertices[:, 0]))
-        min_y = int(np.min(vertices[:, 1]))
-        max_y = int(np.max(vertices[:, 1]))
-
-        #generate the array of pixels within the bounding box
-        pixel_weights = []
-
-        # Generate x and y bounding box coordinates
-        x_coords = np.arange(min_x - 1, max_x + 1)
-        y_coords = np.arange(min_y - 1, max_y + 1)
-        x_mesh, y_mesh = np.meshgrid(x_coords, y_coords)
-        pixel_coords = np.column_stack((x_mesh.ravel(), y_mesh.ravel()))
-
-        center_x = vertices[:, 0].mean() #determine the simplex using the center of the triangle
-        center_y = vertices[:, 1].mean()
-        center = np.array([center_x, center_y])
-        simplex = self.triangulation.find_simplex(center)
-
-        #calculate the barycentric coordinates of each pixel
-        coords = self._calculate_barycentric_coords(pixel_coords, simplex)
-        valid_indices = np.logical_and(np.all(coords >= 0, axis=1), np.all(coords <= 1, axis=1))
-        coords = coords[valid_indices]
-        pixel_coords = pixel_coords[valid_indices]
-        
-        #compute the weighted sum of vertex weights.
-        pixel_weights = np.sum(coords * weight_vals, axis=1)
+    def _collect_band(self, result : tuple, triangle_pixels : list, n_triangle_pixels : list, triangle_weights : list) -> None:
+        pixels, n_pixels, pixel_weights = result
 
-        #calculate the neighboring pixel coordinates
-        n_pixel_coords = np.round(np.sum(coords[:, :, np.newaxis] * n_vertices[np.newaxis, :, :], axis=1)).astype(np.int32)
+        if (self.blending_image is not None):
+            self.blending_image[pixels[:, 0], pixels[:, 1], 0] = pixel_weights
+            self.blending_image[pixels[:, 0], pixels[:, 1], 1] = n_pixels[:, 0]
+            self.blending_image[pixels[:, 0], pixels[:, 1], 2] = n_pixels[:, 1]
+        else:
+            triangle_pixels.append(pixels)
+            n_triangle_pixels.append(n_pixels)
+            triangle_weights.append(pixel_weights)
 
-        return pixel_coords, n_pixel_coords, pixel_weights
+    #split the bounding box of the triangulation (clipped to the image) into bands of roughly band_pixels pixels
+    def _get_pixel_bands(self, band_pixels : int) -> list:
+        min_x, min_y = np.floor(self.vertex_coords.min(axis=0)).astype(np.int64) - 1
+        max_x, max_y = np.ceil(self.vertex_coords.max(axis=0)).astype(np.int64) + 1
 
-    def _calculate_barycentric_coords(self, points, simplex):
-        simp = self.triangulation
+        #the blending image has shape (cols, rows), see _save_blending_image
+        min_x, max_x = max(min_x, 0), min(max_x, self.data.cols)
+        min_y, max_y = max(min_y, 0), min(max_y, self.data.rows)
 
-        b0 = (simp.transform[[simplex], :points.shape[1]].transpose([1, 0, 2]) *
-            (points - simp.transform[[simplex], points.shape[1]])).sum(axis=2).T
-        coords = np.c_[b0, 1 - b0.sum(axis=1)]
+        if (max_x <= min_x or max_y <= min_y):
+            return []
+
+        band_width = max(1, band_pixels // (max_y - min_y))
+
+        return [(x, min(x + band_width, max_x), min_y, max_y) for x in range(min_x, max_x, band_width)]
+
+    #see TriangleRasterizer, which also checks the result against the original per triangle rasterizer
+    def _rasterize_band(self, band : tuple) -> tuple:
+        return TriangleRasterizer.rasterize_band(self.triangulation, self.vertex_weights, self.neighboring_tex_coords, band)
 
-        return coords
-        
     def _save_blending_image(self):
         #convert pixels and associated weights into an image the same size as the original
         x = self.data.cols
@@ -331,4 +459,21 @@ class ImageBlender():
         image = image.reshape(x, y, 3)
 
         print('Saving blending image...')
-        np.save(f'images/blending_masks/{self.resolution}/{self.satellite}_{self.adjacent_satellite}.npy', image)
\ No newline at end of file
+        np.save(self.output_file, image)
+
+    #preallocate the blending image as a zero filled memory-mapped .npy file. It is written under a temporary
+    #name so an interrupted run never leaves a mask behind that diagnostics would consider complete
+    def _open_blending_image(self):
+        self.blending_image = np.lib.format.open_memmap(self._get_partial_file(), mode='w+', dtype=np.float64,
+                                                        shape=(self.data.cols, self.data.rows, 3))
+
+    def _close_blending_image(self):
+        print('Saving blending image...')
+        self.blending_image.flush()
+        del(self.blending_image)
+        self.blending_image = None
+        os.replace(self._get_partial_file(), self.output_file)
+
+    #diagnostics looks for the mask name anywhere in the file names, so the temporary name must not contain it
+    def _get_partial_file(self) -> str:
+        return os.path.splitext(self.output_file)[0] + '.partial.tmp'
\ No newline at end of file
@@ -6,16 +6,34 @@ from PIL import Image
 Image.MAX_IMAGE_PIXELS = None #disable PIL preventing large image loading
 import open3d as o3d
 from datetime import datetime
+import os
+
+from src.texture_cache import texture_cache
+from src.icosphere import Icosphere
+from src.texture_streamer import decoder_pool
+from src.tile_pyramid import TilePyramid
 
 #Each object corresponds to the vertex data for a satellite. This data is generated by the
 #TiffImage class from image_handler.py and saved to a .npy file. That class also generates the
 #texture coordinates for each satellite, which is handled by the Texture class.
+#an object has several mesh levels of detail (icospheres of different subdivisions, see TiffImage.save_lod),
+#and the renderer draws the coarsest one whose error is too small to be seen at the current zoom
+
+#with a SatelliteProjection, the texture coordinates are computed in the fragment shader and the levels are
+#generated icospheres, so no precomputed vertex or texture coordinates are needed. The data/lod levels built
+#by AssetBuilder.build_mesh_lods are only loaded without a projection (GLInstance.shader_projection off)
 
 class Object():
-    def __init__(self, satellite : str) -> None:
+    def __init__(self, satellite : str, projection=None) -> None:
         self.satellite = satellite
-
-        if (glob(f'data/vertex_coords/{self.satellite}_indices.npy')):
+        self.projection = projection
+        #raw band images ({timestamp: {band: file}}) and the composite recipe evaluated from them in the shader
+        self.band_files = {}
+        self.recipe = None
+
+        if (projection is not None):
+            self._generate_levels()
+        elif (glob(f'data/vertex_coords/{self.satellite}_indices.npy')):
             try:
                 #load vertices from file
                 self.vertices = np.load(f'data/vertex_coords/{self.satellite}_vertex_coords.npy')
@@ -29,13 +47,13 @@ class Object():
             Object._mesh_reconstruction(self.vertices.reshape(-1, 3))        
             np.save(f'data/vertex_coords/{self.satellite}_indices.npy', self.indices)
 
+        if (projection is None):
+            self._load_levels()
+
         self.image_textures = Texture(self.satellite, ['images/default_image.png'])
-        self.tbos = self.image_textures.tbos
         self.textures = self.image_textures.textures
-        self.texture_coords = self.image_textures.tile_tex_coords
         self.num_layers = self.image_textures.num_layers
-
-        self._initialize_gl_vertex_data()
+        [level.attach_texture(self.image_textures) for level in self.levels]
         
     def _mesh_reconstruction(points) -> None:
         # Create an Open3D point cloud
@@ -56,165 +74,598 @@ class Object():
         indices = np.asarray(mesh.triangles).flatten()
 
         return mesh, indices
+
+    #the main mesh (cut from models/ico_6div.obj) is always a level, the generated levels are used if they exist.
+    #levels are ordered from the coarsest to the finest
+    def _load_levels(self) -> None:
+        texture_coordinates = np.load(f'data/texture_coords/{self.satellite}_tex_coords.npy')
+        levels = [MeshLevel(self.vertices, self.indices, texture_coordinates)]
+
+        for file in glob(f'data/lod/{self.satellite}_lod*_indices.npy'):
+            prefix = file[:-len('_indices.npy')]
+
+            try:
+                error_file = f'{prefix}_error.npy'
+                error = float(np.load(error_file)[0]) if os.path.exists(error_file) else None
+                levels.append(MeshLevel(np.load(f'{prefix}_vertex_coords.npy'), np.load(file),
+                                        np.load(f'{prefix}_tex_coords.npy'), error))
+            except Exception as e:
+                print(f'Failed to load the mesh level {prefix}.')
+                print(e)
+
+        self.levels = sorted(levels, key=lambda level: level.num_triangles)
+
+    #every level is cut to the satellite's view, widened by one edge so the triangles crossing the edge of the
+    #view are kept (the fragment shader discards what the satellite can't see). The vertex texture coordinates
+    #only decide which tiles a triangle is drawn with, and are widened at the seams since the shader's
+    #coordinates don't vary linearly across the coarse triangles
+    def _generate_levels(self, subdivisions : tuple=(2, 3, 4, 5, 6), seam_texels : int=64) -> None:
+        center, cap_cos = self.projection.get_view_cap()
+        levels = []
+
+        for n in subdivisions:
+            vertices, indices = Icosphere.create(n)
+            triangles = indices.reshape(-1, 3)
+            edge_angle = np.max(np.arccos(np.clip(np.sum(vertices[triangles[:, 0]] * vertices[triangles[:, 1]], axis=1), -1.0, 1.0)))
+
+            in_view = vertices @ center >= np.cos(np.arccos(cap_cos) + edge_angle)
+            triangles = triangles[in_view[triangles].any(axis=1)]
+
+            used = np.zeros(len(vertices), dtype=bool)
+            used[triangles] = True
+            remap = np.cumsum(used) - 1
+            vertices = vertices[used]
+            tex_coords, _ = self.projection.project(vertices)
+
+            levels.append(MeshLevel(vertices.flatten(), remap[triangles].flatten().astype(np.uint32),
+                                    tex_coords.flatten(), seam_texels=seam_texels))
+
+        self.levels = levels
+        self.vertices = levels[-1].vertices
+        self.indices = levels[-1].indices
+
+    #returns the coarsest level whose error covers less than max_error pixels on the screen
+    def select_level(self, pixels_per_unit : float, max_error : float=0.5):
+        for level in self.levels:
+            if (level.error * pixels_per_unit <= max_error):
+                return level
+
+        return self.levels[-1]
     
-    def load_textures(self, files) -> None:
+    #time series longer than ring_size frames only keep a ring of frames around the playhead on the GPU
+    def load_textures(self, files, use_texture_array : bool=False, streamer=None, ring_size : int=None) -> None:
         print(files)
-        self.image_textures = Texture(self.satellite, files)
-        self.tbos = self.image_textures.tbos
+
+        if (use_texture_array and ring_size is not None and len(files) > ring_size):
+            self.image_textures = RingTexture(self.satellite, files, ring_size, streamer)
+        else:
+            self.image_textures = Texture(self.satellite, files, use_texture_array, streamer)
+
         self.textures = self.image_textures.textures                #list of texture arrays for each tile
-        self.texture_coords = self.image_textures.tile_tex_coords   #list of texture coordinates for each tile
         self.num_layers = self.image_textures.num_layers
+        [level.attach_texture(self.image_textures) for level in self.levels]
 
-    def _initialize_gl_vertex_data(self) -> None:
-        vao = glGenVertexArrays(1)
-        glBindVertexArray(vao)
+    #stream the visible tiles of the frames' pyramids instead of uploading the whole frames (needs a projection)
+    def load_pyramid_textures(self, files, streamer) -> None:
+        self.image_textures = PyramidTexture(self.satellite, files, streamer)
+        self.textures = []
+        self.num_layers = self.image_textures.num_layers
+        [level.attach_texture(self.image_textures) for level in self.levels]
+
+    #detach the current texture without deleting it, so it can be drawn again after restore_textures.
+    #returns what restore_textures needs
+    def stash_textures(self) -> tuple:
+        [level.detach_texture() for level in self.levels]
+
+        return self.image_textures, self.recipe, self.band_files
+
+    #delete the current texture and attach a stashed one again
+    def restore_textures(self, stashed : tuple) -> None:
+        self.clear_images()
+        self.image_textures, self.recipe, self.band_files = stashed
+        self.textures = [] if self.image_textures.is_pyramid else self.image_textures.textures
+        self.num_layers = self.image_textures.num_layers
+        [level.attach_texture(self.image_textures) for level in self.levels]
 
+    def clear_images(self) -> None:
+        [level.detach_texture() for level in self.levels]
+        self.image_textures.delete()
+        self.textures = []
+        self.num_layers = 0
+
+    def delete(self) -> None:
+        [level.delete() for level in self.levels]
+        self.image_textures.delete()
+        self.levels = []
+
+        del(self.vertices)
+        del(self.indices)
+
+#one level of detail of a satellite mesh. It holds the vertex buffer, the patches used for culling, and the
+#per tile texture coordinate buffers, index buffers and vertex arrays of the current texture
+class MeshLevel():
+    def __init__(self, vertices : np.ndarray, indices : np.ndarray, texture_coordinates : np.ndarray, error : float=None,
+                 seam_texels : int=2) -> None:
+        self.vertices = vertices
+        self.indices = indices
+        self.texture_coordinates = texture_coordinates
+        self.seam_texels = seam_texels
+        self.num_triangles = len(indices) // 3
+        #levels generated without an error estimate only account for the flat triangles
+        self.error = error if error is not None else self._get_geometric_error()
+
+        self.tbos = []
+        self.tile_vaos = []
+        self.tile_ebos = []
+        self.tile_lengths = []
+        self.tile_patch_ranges = []
+
+        self._initialize_gl_vertex_data()
+        self._build_patches()
+
+    #the largest distance between the middle of a triangle edge and the sphere
+    def _get_geometric_error(self) -> float:
+        vertices = self.vertices.reshape(-1, 3).astype(np.float64)
+        triangles = self.indices.reshape(-1, 3)
+        radius = np.mean(np.linalg.norm(vertices, axis=1))
+        edge_length = np.max(np.linalg.norm(vertices[triangles[:, 0]] - vertices[triangles[:, 1]], axis=1))
+
+        return float(radius * (1.0 - np.cos(edge_length / (2.0 * radius))))
+
+    def _initialize_gl_vertex_data(self) -> None:
         vbo = glGenBuffers(1)
         glBindBuffer(GL_ARRAY_BUFFER, vbo)
         glBufferData(GL_ARRAY_BUFFER, self.vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
 
-        ebo = glGenBuffers(1)
-        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ebo)
-        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.indices, GL_STATIC_DRAW)
+        self.vbo = vbo
 
-        #position attribute
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, None)
-        glEnableVertexAttribArray(0)
+    #create the texture coordinate buffers and the vertex arrays for the tiles of a texture
+    def attach_texture(self, texture) -> None:
+        self.detach_texture()
+        self.texture = texture
+        self.texture_coords = texture.get_tile_coords(self.texture_coordinates)
+        self.tbos = []
 
-        glBindBuffer(GL_ARRAY_BUFFER, 0)
-        glBindVertexArray(0)
+        #A list of texture buffers for each tile. Will be identical for each timeseries image
+        for tile_coords in self.texture_coords:
+            tbo = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, tbo)
+            glBufferData(GL_ARRAY_BUFFER, tile_coords, GL_STATIC_DRAW)
+            self.tbos.append(tbo)
 
-        self.vao, self.vbo, self.ebo = vao, vbo, ebo
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self._initialize_tile_vaos()
 
-    def clear_images(self) -> None:
-        self.image_textures.delete()
+    def detach_texture(self) -> None:
+        self._delete_tile_vaos()
+        [glDeleteBuffers(1, tbo) for tbo in self.tbos]
         self.tbos = []
-        self.textures = []
         self.texture_coords = []
-        self.num_layers = 0
+
+    #one vertex array per texture tile that already holds the position, tile texture coordinate and index
+    #buffer bindings, so drawing a tile only needs the vertex array and its texture to be bound.
+    #each tile has its own index buffer with only the triangles that sample that tile
+    def _initialize_tile_vaos(self) -> None:
+        tile_vaos = []
+        tile_ebos = []
+        tile_lengths = []
+        tile_patch_ranges = []
+
+        for tbo, (tile_indices, patch_ranges) in zip(self.tbos, self._get_tile_indices()):
+            ebo = glGenBuffers(1)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ebo)
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, tile_indices, GL_STATIC_DRAW)
+            tile_ebos.append(ebo)
+            tile_lengths.append(len(tile_indices))
+            tile_patch_ranges.append(patch_ranges)
+
+            vao = glGenVertexArrays(1)
+            glBindVertexArray(vao)
+
+            #position attribute
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, None)
+            glEnableVertexAttribArray(0)
+
+            #texture coordinate attribute
+            glBindBuffer(GL_ARRAY_BUFFER, tbo)
+            glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 0, None)
+            glEnableVertexAttribArray(1)
+
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ebo)
+            tile_vaos.append(vao)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+        self.tile_vaos = tile_vaos
+        self.tile_ebos = tile_ebos
+        self.tile_lengths = tile_lengths
+        self.tile_patch_ranges = tile_patch_ranges #(offsets, counts) of each patch in each tile's index buffer
+
+    #split the mesh into patches on a longitude/latitude grid (equal area latitude bands). Each patch gets a
+    #bounding sphere for view volume tests and a normal cone for back face tests. On the sphere the normal
+    #of a vertex is its direction from the origin
+    def _build_patches(self, lon_bins : int=16, lat_bins : int=8) -> None:
+        vertices = self.vertices.reshape(-1, 3).astype(np.float64)
+        triangles = self.indices.reshape(-1, 3)
+        directions = vertices / np.linalg.norm(vertices, axis=1)[:, np.newaxis]
+
+        centroids = directions[triangles].mean(axis=1)
+        lon = np.arctan2(centroids[:, 1], centroids[:, 0])
+        sin_lat = centroids[:, 2] / np.linalg.norm(centroids, axis=1)
+        lon_idx = np.clip(((lon + np.pi) / (2 * np.pi) * lon_bins).astype(np.int64), 0, lon_bins - 1)
+        lat_idx = np.clip(((sin_lat + 1.0) / 2.0 * lat_bins).astype(np.int64), 0, lat_bins - 1)
+
+        self.num_patches = lon_bins * lat_bins
+        self.triangle_patches = lat_idx * lon_bins + lon_idx
+
+        self.patch_axes = np.zeros((self.num_patches, 3))
+        self.patch_centers = np.zeros((self.num_patches, 3))
+        self.patch_radii = np.zeros(self.num_patches)
+        #(u_min, v_min, u_max, v_max) of the image texture coordinates, empty for patches without triangles
+        tex_coords = self.texture_coordinates.reshape(-1, 2)
+        self.patch_tex_bounds = np.tile([1.0, 1.0, 0.0, 0.0], (self.num_patches, 1))
+        #a patch faces away from the camera when the view space z of its axis is below this threshold
+        self.patch_cone_thresholds = np.full(self.num_patches, -np.inf)
+
+        for patch in np.unique(self.triangle_patches):
+            patch_vertices = np.unique(triangles[self.triangle_patches == patch])
+            axis = directions[patch_vertices].sum(axis=0)
+            axis /= np.linalg.norm(axis)
+            cone_angle = np.arccos(np.clip(np.min(directions[patch_vertices] @ axis), -1.0, 1.0))
+            center = vertices[patch_vertices].mean(axis=0)
+
+            self.patch_axes[patch] = axis
+            self.patch_centers[patch] = center
+            self.patch_radii[patch] = np.max(np.linalg.norm(vertices[patch_vertices] - center, axis=1))
+            self.patch_cone_thresholds[patch] = np.cos(min(np.pi / 2.0 + cone_angle, np.pi))
+            self.patch_tex_bounds[patch] = np.concatenate((tex_coords[patch_vertices].min(axis=0),
+                                                           tex_coords[patch_vertices].max(axis=0)))
+
+    #view is the row major view matrix and half_width/half_height are half the size of the orthographic view volume
+    def get_visible_patches(self, view : np.ndarray, half_width : float, half_height : float) -> np.ndarray:
+        rotation = view[:3, :3]
+        axes = self.patch_axes @ rotation.T
+        centers = self.patch_centers @ rotation.T + view[:3, 3]
+
+        #the camera looks down the negative z axis in view space
+        front_facing = axes[:, 2] >= self.patch_cone_thresholds
+        in_view = np.logical_and(np.abs(centers[:, 0]) <= half_width + self.patch_radii,
+                                 np.abs(centers[:, 1]) <= half_height + self.patch_radii)
+
+        return np.logical_and(front_facing, in_view)
+
+    #returns (offset, count) draw ranges in the tile's index buffer for the visible patches. Visible patches
+    #that are next to each other in the buffer are merged into a single draw
+    def get_draw_ranges(self, tile : int, visible : np.ndarray) -> list:
+        offsets, counts = self.tile_patch_ranges[tile]
+        ranges = []
+        start, end = None, 0
+
+        for patch in np.flatnonzero(np.logical_and(visible, counts > 0)):
+            if (start is not None and offsets[patch] == end):
+                end += counts[patch]
+            else:
+                if (start is not None):
+                    ranges.append((start, end - start))
+
+                start, end = offsets[patch], offsets[patch] + counts[patch]
+
+        if (start is not None):
+            ranges.append((start, end - start))
+
+        return ranges
+
+    #a triangle samples a tile if its texture coordinates in tile space overlap the 0-1 range. The range is
+    #widened by a few texels so triangles along the seams between tiles are drawn by both tiles
+    #the triangles of each tile are sorted by patch so every patch is a contiguous range of the index buffer
+    def _get_tile_indices(self) -> list:
+        triangles = self.indices.reshape(-1, 3)
+        margin_x = self.seam_texels / self.texture.tile_width
+        margin_y = self.seam_texels / self.texture.tile_height
+        tile_indices = []
+
+        for tile_coords in self.texture_coords:
+            triangle_coords = tile_coords.reshape(-1, 2)[triangles] #(triangles, 3 vertices, uv)
+            low = triangle_coords.min(axis=1)
+            high = triangle_coords.max(axis=1)
+
+            mask = np.logical_and.reduce((high[:, 0] >= -margin_x, low[:, 0] <= 1.0 + margin_x,
+                                          high[:, 1] >= -margin_y, low[:, 1] <= 1.0 + margin_y))
+
+            tile_triangles = np.flatnonzero(mask)
+            tile_triangles = tile_triangles[np.argsort(self.triangle_patches[tile_triangles], kind='stable')]
+            counts = np.bincount(self.triangle_patches[tile_triangles], minlength=self.num_patches) * 3
+            offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+            tile_indices.append((triangles[tile_triangles].flatten().astype(np.uint32), (offsets, counts)))
+
+        return tile_indices
+
+    def _delete_tile_vaos(self) -> None:
+        [glDeleteVertexArrays(1, vao) for vao in self.tile_vaos]
+        [glDeleteBuffers(1, ebo) for ebo in self.tile_ebos]
+        self.tile_vaos = []
+        self.tile_ebos = []
+        self.tile_lengths = []
+        self.tile_patch_ranges = []
 
     def delete(self) -> None:
-        glDeleteVertexArrays(1, self.vao)
+        self.detach_texture()
         glDeleteBuffers(1, self.vbo)
-        glDeleteBuffers(1, self.ebo)
-        self.image_textures.delete()
 
         del(self.vertices)
         del(self.indices)
     
 
 #the Texture class should only use images selected by the user
-#class to handle texture loading, binding, and tiling
+#class to handle texture loading, binding, and tiling.
+#with use_texture_array every time step of a tile is stored as one layer of a single GL_TEXTURE_2D_ARRAY,
+#so the time step is selected in the shader with the 'layer' uniform instead of binding another texture.
+#if a TextureStreamer is given, only the texture storage is allocated here and the images are decoded in
+#the background and uploaded layer by layer. loaded_layers holds the layers that are ready to be drawn.
+#GPU textures come from the process wide texture cache, so layers that are still resident aren't uploaded again
 class Texture():
-    def __init__(self, satellite : str, files : list) -> None:
+    is_pyramid = False
+    is_ring = False
+
+    def __init__(self, satellite : str, files : list, use_texture_array : bool=False, streamer=None) -> None:
         self.satellite = satellite
         image_files = files
         
         if (len(image_files) > 1):
-            self.images = self._get_timeseries_images(image_files)
+            self.files = self._get_timeseries_files(image_files)
         else:
-            self.images = [Image.open(image_files[0])]
+            self.files = list(image_files)
 
-        self.num_layers = len(self.images)
-        self.texture_coordinates = np.load(f'data/texture_coords/{self.satellite}_tex_coords.npy')
+        #only the image size is read here, the pixels are decoded into one RGBA buffer per layer later
+        self.images = [Image.open(Texture._get_file_name(self.files[0]))]
+
+        self.mtimes = [Texture._get_mtime(file) for file in self.files]
+        self.width = self.images[0].width
+        self.height = self.images[0].height
+        self.num_layers = len(self.files)
         self.max_size = glGetIntegerv(GL_MAX_TEXTURE_SIZE)
 
         self.slider_value = 0.0
+        self.loaded_layers = set()
+        self.deleted = False
+
+        #fall back to a texture per layer if the time series doesn't fit in an array texture
+        self.use_texture_array = use_texture_array and self.num_layers <= glGetIntegerv(GL_MAX_ARRAY_TEXTURE_LAYERS)
 
         self._get_tiles()
-        self._generate_tile_texture_data()
-        self._generate_tile_coords()
-        self._init_textures()
-        self._generate_texture_buffers()
+        self._allocate_textures()
+        self._release_images()
+        self._load_layers(streamer)
+
+    def _load_layers(self, streamer) -> None:
+        if (streamer is not None):
+            for layer, file in enumerate(self.files):
+                if (layer not in self.loaded_layers):
+                    streamer.submit(self, layer, file)
+        else:
+            self._init_textures()
 
-    #return a timeseries ordered list of Image objects 
-    def _get_timeseries_images(self, image_files : list) -> list: #returns an ordered list of Image objects
+    #return a timeseries ordered list of image files
+    def _get_timeseries_files(self, image_files : list) -> list:
         timestamp_format = '%Y%m%d_%H%M'
         timestamps = []
 
         for file in image_files:
-            date_str = file.split('_')[-2:]
+            date_str = Texture._get_file_name(file).split('_')[-2:]
             date_str = str(date_str[0] + '_' + date_str[1]).split('.')[0]
             date = datetime.strptime(date_str, timestamp_format)
             timestamps.append(date)
         
         timestamps = sorted(timestamps)
         ts_str = [date.strftime(timestamp_format) for date in timestamps]
-        image_files = [i for i in image_files for j in ts_str if j in i]
+        image_files = [i for i in image_files for j in ts_str if j in Texture._get_file_name(i)]
 
-        return [Image.open(file) for file in image_files]
+        return image_files
 
-    def _generate_texture_buffers(self) -> None:
-        tbos = []
+    #a layer is either one image file, or a tuple of band files that are packed into the channels of one image
+    def _get_file_name(file) -> str:
+        return file[0] if isinstance(file, tuple) else file
 
-        #A list of texture buffers for each tile. Will be identical for each timeseries image
-        for i in range(self.num_tiles):
-            tbo = glGenBuffers(1)
-            glBindBuffer(GL_ARRAY_BUFFER, tbo)
-            glBufferData(GL_ARRAY_BUFFER, self.tile_tex_coords[i], GL_STATIC_DRAW)
-            glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 0, None)
-            glEnableVertexAttribArray(1)
-            tbos.append(tbo)
-            glBindBuffer(GL_ARRAY_BUFFER, 0)
+    def _get_mtime(file):
+        if (isinstance(file, tuple)):
+            return tuple(os.path.getmtime(band) for band in file)
 
-        self.tbos = tbos
+        return os.path.getmtime(file)
 
-    def _init_textures(self) -> None:
+    def _get_file_key(file):
+        if (isinstance(file, tuple)):
+            return tuple(os.path.abspath(band) for band in file)
+
+        return os.path.abspath(file)
+
+    #cache keys identify the image data of a texture: (file, tile, mtime) for a single layer, and the
+    #tuples of every layer's files and mtimes for an array texture
+    def _get_cache_key(self, layer : int, tile : int) -> tuple:
+        if (self.use_texture_array):
+            return (tuple(Texture._get_file_key(file) for file in self.files), tile, tuple(self.mtimes))
+
+        return (Texture._get_file_key(self.files[layer]), tile, self.mtimes[layer])
+
+    #get the texture storage for every layer and tile from the cache, or create it (empty) if it isn't cached
+    def _allocate_textures(self) -> None:
         all_textures = []
-        
+        all_keys = []
+
+        if (self.use_texture_array):
+            hits = 0
+
+            #one array texture per tile, each layer of the array is one image of the time series
+            for i in range(self.num_tiles):
+                key = self._get_cache_key(0, i)
+                texture, complete = texture_cache.acquire(key)
+
+                if (texture is None):
+                    texture = glGenTextures(1)
+                    glBindTexture(GL_TEXTURE_2D_ARRAY, texture)
+                    glTexImage3D(GL_TEXTURE_2D_ARRAY, 0, GL_RGBA8, self.tile_width, self.tile_height,
+                                 self.num_layers, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+                    Texture._set_texture_parameters(GL_TEXTURE_2D_ARRAY)
+                    texture_cache.add(key, texture, self.tile_width * self.tile_height * 4 * self.num_layers)
+                elif (complete):
+                    hits += 1
+
+                all_textures.append(texture)
+                all_keys.append(key)
+
+            glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+
+            #a single 'layer' holding every tile, so the tile loop in the renderer is unchanged
+            self.textures = [all_textures]
+            self.cache_keys = [all_keys]
+
+            if (hits == self.num_tiles):
+                self.loaded_layers = set(range(self.num_layers))
+
+            return
+
         #loop through each tile (same for all images) and create a texture for each layer
         for j in range(self.num_layers):
             layer_textures = []
+            layer_keys = []
+            hits = 0
 
             for i in range(self.num_tiles):
-                texture = glGenTextures(1)
-                glBindTexture(GL_TEXTURE_2D, texture)
-                glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.tile_width, 
-                            self.tile_height, 0, GL_RGBA, GL_UNSIGNED_BYTE, np.asarray(self.tile_images[j][i]).flatten())
-                glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE) #set texture wrapping parameters
-                glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
-                #set texture filtering parameters
-                glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-                glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+                key = self._get_cache_key(j, i)
+                texture, complete = texture_cache.acquire(key)
+
+                if (texture is None):
+                    texture = glGenTextures(1)
+                    glBindTexture(GL_TEXTURE_2D, texture)
+                    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.tile_width, 
+                                self.tile_height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+                    Texture._set_texture_parameters(GL_TEXTURE_2D)
+                    texture_cache.add(key, texture, self.tile_width * self.tile_height * 4)
+                elif (complete):
+                    hits += 1
 
                 layer_textures.append(texture)
+                layer_keys.append(key)
 
             all_textures.append(layer_textures)
+            all_keys.append(layer_keys)
+
+            if (hits == self.num_tiles):
+                self.loaded_layers.add(j)
+
+        glBindTexture(GL_TEXTURE_2D, 0)
 
         self.textures = all_textures #[[layer1_tile1, layer1_tile2, ...], [layer2_tile1, layer2_tile2, ...]
+        self.cache_keys = all_keys
+
+    def _set_texture_parameters(target) -> None:
+        glTexParameteri(target, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE) #set texture wrapping parameters
+        glTexParameteri(target, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        #set texture filtering parameters
+        glTexParameteri(target, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(target, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+
+    #the frames are decoded in parallel and uploaded in timestamp order as they complete
+    def _init_textures(self) -> None:
+        layers = [j for j in range(self.num_layers) if j not in self.loaded_layers]
+
+        for j, pixels in zip(layers, decoder_pool.decode_ordered([self.files[j] for j in layers])):
+            if (pixels is None):
+                continue
+
+            #every tile is uploaded straight from the decoded frame
+            for i in range(self.num_tiles):
+                self.upload_tile(j, i, pixels)
+
+            self.mark_layer_loaded(j)
+
+    #the layer can be drawn, and once every pixel of a texture is uploaded it can be reused from the cache
+    def mark_layer_loaded(self, layer : int) -> None:
+        self.loaded_layers.add(layer)
+
+        if (self.use_texture_array):
+            if (len(self.loaded_layers) == self.num_layers):
+                [texture_cache.mark_complete(key) for key in self.cache_keys[0]]
+        else:
+            [texture_cache.mark_complete(key) for key in self.cache_keys[layer]]
+
+    #upload the pixels of one tile of one layer. pixels is either the whole decoded (height, width, 4) frame,
+    #from which the tile is selected with the unpack row length and skip parameters so it never has to be
+    #copied out, or None when the tile's pixels come from a bound pixel unpack buffer
+    def upload_tile(self, layer : int, tile : int, pixels) -> None:
+        if (pixels is not None):
+            x, y = self.get_tile_origin(tile)
+            glPixelStorei(GL_UNPACK_ROW_LENGTH, self.width)
+            glPixelStorei(GL_UNPACK_SKIP_PIXELS, x)
+            glPixelStorei(GL_UNPACK_SKIP_ROWS, y)
+
+        if (self.use_texture_array):
+            glBindTexture(GL_TEXTURE_2D_ARRAY, self.textures[0][tile])
+            glTexSubImage3D(GL_TEXTURE_2D_ARRAY, 0, 0, 0, layer, self.tile_width, self.tile_height, 1,
+                            GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+            glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+        else:
+            glBindTexture(GL_TEXTURE_2D, self.textures[layer][tile])
+            glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, self.tile_width, self.tile_height,
+                            GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+            glBindTexture(GL_TEXTURE_2D, 0)
+
+        if (pixels is not None):
+            glPixelStorei(GL_UNPACK_ROW_LENGTH, 0)
+            glPixelStorei(GL_UNPACK_SKIP_PIXELS, 0)
+            glPixelStorei(GL_UNPACK_SKIP_ROWS, 0)
+
+    #the (x, y) pixel position of the tile's top left corner in the frame
+    def get_tile_origin(self, tile : int) -> tuple:
+        return (tile // self.num_tiles_y) * self.tile_width, (tile % self.num_tiles_y) * self.tile_height
+
+    #returns the closest layer to the requested one that has been uploaded, or None if nothing is loaded yet
+    def get_loaded_layer(self, layer : int):
+        if (layer in self.loaded_layers):
+            return layer
+
+        if (not self.loaded_layers):
+            return None
+
+        return min(self.loaded_layers, key=lambda loaded: abs(loaded - layer))
+
+    #returns the (first, second, mix) texture layers drawn at a fractional playback position, or None if
+    #nothing is loaded yet. The shader blends the two layers, which is only possible with array textures
+    def get_frame_layers(self, position : float):
+        first = self.get_loaded_layer(int(position))
+
+        if (first is None):
+            return None
+
+        second = min(first + 1, self.num_layers - 1)
+
+        if (second not in self.loaded_layers or not self.use_texture_array):
+            return first, first, 0.0
+
+        #when the frame at the position isn't loaded yet, the closest loaded one is shown on its own
+        mix = position - first if int(position) == first else 0.0
+
+        return first, second, mix
+
+    #the streamer skips frames the texture doesn't want anymore
+    def wants_layer(self, layer : int) -> bool:
+        return not self.deleted
             
     def _get_tiles(self) -> None:
-        self.num_tiles_x = (self.images[0].width // self.max_size) + 1
-        self.num_tiles_y = (self.images[0].height // self.max_size) + 1
+        self.num_tiles_x = (self.width // self.max_size) + 1
+        self.num_tiles_y = (self.height // self.max_size) + 1
         self.num_tiles = self.num_tiles_x * self.num_tiles_y
-        self.tile_width = self.images[0].width // self.num_tiles_x
-        self.tile_height = self.images[0].height // self.num_tiles_y
-
-    def _generate_tile_texture_data(self) -> None:
-        #for each tile, create a new image and save it to a list
-        timeseries_tile_images = [] #list of lists of images [ts1_tiles, ts2_tiles, ...]
-        tile_images = []
-
-        if self.num_tiles > 1:
-            for image in self.images:
-                x_offsets = [x * self.tile_width for x in range(self.num_tiles_x)] #x offsets for each tile
-                y_offsets = [y * self.tile_height for y in range(self.num_tiles_y)] #y offsets for each tile
-                #we need an array of length num_tiles_x * num_tiles_y, where each element is a tuple of (x, y) offsets
-                #       _______
-                #order |_1_|_3_|
-                #      |_2_|_4_|
-
-                combined = [(x, y) for x in x_offsets for y in y_offsets]
-                tile_images = [image.crop((x, y, x + self.tile_width, y + self.tile_height)) for x, y in combined]
-                timeseries_tile_images.append(tile_images)
-        else:
-            timeseries_tile_images = [[image] for image in self.images]
-        
-        self.tile_images = timeseries_tile_images
+        self.tile_width = self.width // self.num_tiles_x
+        self.tile_height = self.height // self.num_tiles_y
 
-    def _generate_tile_coords(self) -> None:
+    #returns the texture coordinates of a mesh for each tile of the texture
+    def get_tile_coords(self, texture_coordinates : np.ndarray) -> list:
         tile_tex_coords = [] #texture coordinates for each tile
-        tex_coords = self.texture_coordinates.reshape(-1, 2)
+        tex_coords = texture_coordinates.reshape(-1, 2)
         #for each tile in the image, we must define new texture coordinates by 
         #scaling the original texture coordinates by the tile width and height
         #and then translating them by the tile's x and y position
@@ -222,26 +673,193 @@ class Texture():
         #order |_1_|_3_|
         #      |_2_|_4_|
 
-        for x in range(0, self.num_tiles_x):
-            for y in range(0, self.num_tiles_y):
-                x_offset = (x * self.tile_width) / self.images[0].width
-                y_offset = (y * self.tile_height) / self.images[0].height
-                x_scale = self.tile_width / self.images[0].width
-                y_scale = self.tile_height / self.images[0].height
+        for tile in range(self.num_tiles):
+            x_offset, y_offset, x_scale, y_scale = self.get_tile_transform(tile)
+
+            #scale the texture coordinates and then translate them
+            tile_coords = np.column_stack((tex_coords[:, 0] - x_offset, tex_coords[:, 1] - y_offset))
+            tile_coords = np.column_stack((tile_coords[:, 0] / x_scale, tile_coords[:, 1] / y_scale))
+
+            tile_tex_coords.append(tile_coords.flatten())
 
-                #scale the texture coordinates and then translate them
-                tile_coords = np.column_stack((tex_coords[:, 0] - x_offset, tex_coords[:, 1] - y_offset))
-                tile_coords = np.column_stack((tile_coords[:, 0] / x_scale, tile_coords[:, 1] / y_scale))
+        return tile_tex_coords
 
-                tile_tex_coords.append(tile_coords.flatten())
-                #print the length of tile_coords that are inside the range 0-1
+    #returns the (x_offset, y_offset, x_scale, y_scale) that map image texture coordinates to the tile's
+    def get_tile_transform(self, tile : int) -> tuple:
+        x = tile // self.num_tiles_y
+        y = tile % self.num_tiles_y
 
-        self.tile_tex_coords = tile_tex_coords
+        return ((x * self.tile_width) / self.width, (y * self.tile_height) / self.height,
+                self.tile_width / self.width, self.tile_height / self.height)
 
+    #the CPU side images are not needed once the pixels are on the GPU
+    def _release_images(self) -> None:
+        [image.close() for image in self.images]
+        self.images = []
+
+    #the GL textures stay in the texture cache, which deletes them when it needs the memory
     def delete(self) -> None:
-        [glDeleteTextures(1, texture) for layer in self.textures for texture in layer]
-        #clear buffers
-        [glDeleteBuffers(1, tbo) for tbo in self.tbos]
-        #clear images
-        del(self.tile_images)
-        del(self.images)
+        #the texture may already have been removed, its cache keys must only be released once
+        if (self.deleted):
+            return
+
+        #the streamer drops any pending uploads of a deleted texture
+        self.deleted = True
+        [texture_cache.release(key) for layer in self.cache_keys for key in layer]
+
+#A time series texture that only keeps ring_size frames on the GPU, in one array texture per tile with a layer
+#per ring slot. prefetch() assigns the slots to the frames ahead of the playhead in the play direction, reusing
+#the slots of frames that fell out of that window, so arbitrarily long series play with constant memory.
+#the frames are still identified by their index in the series, only upload_tile and get_frame_layers map them
+#to slots. The ring changes all the time, so its textures don't go through the texture cache.
+#uploads are (frame, generation) jobs. A slot's generation changes whenever it is given to a frame, so a job
+#of a frame that was evicted stops uploading, even if the frame came back into the ring since
+class RingTexture(Texture):
+    is_ring = True
+
+    def __init__(self, satellite : str, files : list, ring_size : int, streamer=None) -> None:
+        self.ring_size = ring_size
+        self.slot_frames = [None] * ring_size   #the frame each slot holds or is loading
+        self.slot_generations = [0] * ring_size
+        self.frame_slots = {}
+        super().__init__(satellite, files, True, streamer)
+
+    def _allocate_textures(self) -> None:
+        textures = []
+
+        for i in range(self.num_tiles):
+            texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D_ARRAY, texture)
+            glTexImage3D(GL_TEXTURE_2D_ARRAY, 0, GL_RGBA8, self.tile_width, self.tile_height,
+                         self.ring_size, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+            Texture._set_texture_parameters(GL_TEXTURE_2D_ARRAY)
+            textures.append(texture)
+
+        glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+
+        self.use_texture_array = True
+        self.textures = [textures]
+        self.cache_keys = []
+
+    def _load_layers(self, streamer) -> None:
+        self.streamer = streamer
+        self.prefetch(0.0, 1)
+
+    #the frames of the window, ordered by when the playhead reaches them. Playing backward, the frame after
+    #the playhead is still blended in
+    def _get_window(self, position : float, direction : int) -> list:
+        first = int(position)
+
+        if (direction < 0):
+            return [(first + 1 - i) % self.num_layers for i in range(self.ring_size)]
+
+        return [(first + i) % self.num_layers for i in range(self.ring_size)]
+
+    #load the frames ahead of the playhead that aren't in the ring into the slots of the frames that aren't needed
+    def prefetch(self, position : float, direction : int) -> None:
+        window = self._get_window(position, direction)
+        wanted = set(window)
+        free_slots = [slot for slot, frame in enumerate(self.slot_frames) if frame not in wanted]
+        missing = []
+
+        for frame in window:
+            if (frame in self.frame_slots):
+                continue
+
+            slot = free_slots.pop(0)
+            previous = self.slot_frames[slot]
+
+            if (previous is not None):
+                del self.frame_slots[previous]
+                self.loaded_layers.discard(previous)
+
+            self.slot_frames[slot] = frame
+            self.slot_generations[slot] += 1
+            self.frame_slots[frame] = slot
+            missing.append((frame, self.slot_generations[slot]))
+
+        if (self.streamer is not None):
+            [self.streamer.submit(self, job, self.files[job[0]]) for job in missing]
+            return
+
+        for job, pixels in zip(missing, decoder_pool.decode_ordered([self.files[frame] for frame, generation in missing])):
+            if (pixels is not None):
+                [self.upload_tile(job, i, pixels) for i in range(self.num_tiles)]
+                self.mark_layer_loaded(job)
+
+    #the layers passed by the streamer are the (frame, generation) jobs submitted by prefetch
+    def wants_layer(self, job : tuple) -> bool:
+        frame, generation = job
+        slot = self.frame_slots.get(frame)
+
+        return not self.deleted and slot is not None and self.slot_generations[slot] == generation
+
+    def upload_tile(self, job : tuple, tile : int, pixels) -> None:
+        super().upload_tile(self.frame_slots[job[0]], tile, pixels)
+
+    def mark_layer_loaded(self, job : tuple) -> None:
+        if (self.wants_layer(job)):
+            self.loaded_layers.add(job[0])
+
+    def get_frame_layers(self, position : float):
+        layers = super().get_frame_layers(position)
+
+        if (layers is None):
+            return None
+
+        first, second, mix = layers
+
+        return self.frame_slots[first], self.frame_slots[second], mix
+
+    def delete(self) -> None:
+        if (self.deleted):
+            return
+
+        self.deleted = True
+        [glDeleteTextures(1, texture) for texture in self.textures[0]]
+        self.textures = []
+
+#The texture of a satellite whose frames have tile pyramids (see TilePyramid). It holds no GL textures of its
+#own: the PyramidStreamer streams the tiles the camera sees into its atlas while the satellite is drawn, and
+#the fragment shader samples them through the page table. The whole frame is a single tile for the mesh levels
+class PyramidTexture():
+    is_pyramid = True
+    is_ring = False
+
+    def __init__(self, satellite : str, files : list, streamer) -> None:
+        self.satellite = satellite
+        self.files = Texture._get_timeseries_files(self, files) if len(files) > 1 else list(files)
+        self.pyramids = [TilePyramid.load(file) for file in self.files]
+        self.streamer = streamer
+
+        self.width = self.pyramids[0].width
+        self.height = self.pyramids[0].height
+        self.tile_width = self.width
+        self.tile_height = self.height
+        self.num_tiles = 1
+        self.num_layers = len(self.files)
+        self.use_texture_array = False
+        self.deleted = False
+
+    #every layer can be drawn, the coarsest level is shown until the visible tiles arrive. Only the nearest frame
+    #is streamed, so frames aren't blended
+    def get_loaded_layer(self, layer : int):
+        return layer
+
+    def get_frame_layers(self, position : float):
+        layer = int(round(position))
+
+        return layer, layer, 0.0
+
+    def get_tile_coords(self, texture_coordinates : np.ndarray) -> list:
+        return [texture_coordinates.reshape(-1).astype(np.float32)]
+
+    def get_tile_transform(self, tile : int) -> tuple:
+        return 0.0, 0.0, 1.0, 1.0
+
+    def delete(self) -> None:
+        if (self.deleted):
+            return
+
+        self.deleted = True
+        self.streamer.remove_texture(self)
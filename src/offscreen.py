@@ -0,0 +1,120 @@
+from OpenGL.GL import *
+
+import os
+import ctypes
+
+#A GL context without a window or display server, for rendering on machines without one. The backend is the
+#one PyOpenGL was told to use with the PYOPENGL_PLATFORM environment variable ('egl' or 'osmesa'), which has
+#to be set before OpenGL is imported for the first time (see render_timelapse.py). The context only has a
+#tiny default surface, everything is drawn into an OffscreenFramebuffer
+class OffscreenContext():
+    def __init__(self) -> None:
+        self.backend = os.environ.get('PYOPENGL_PLATFORM', 'egl')
+        self.display = None
+        self.surface = None
+        self.context = None
+        self.buffer = None
+
+        if (self.backend == 'osmesa'):
+            self._create_osmesa()
+        elif (self.backend == 'egl'):
+            self._create_egl()
+        else:
+            raise ValueError(f'Offscreen rendering needs the egl or osmesa platform, not {self.backend}.')
+
+    def _create_egl(self) -> None:
+        from OpenGL import EGL
+
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+
+        if (not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor))):
+            raise RuntimeError('Failed to initialize the EGL display.')
+
+        config_attributes = [EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                             EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8, EGL.EGL_ALPHA_SIZE, 8,
+                             EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_NONE]
+        config = EGL.EGLConfig()
+        num_configs = EGL.EGLint()
+        EGL.eglChooseConfig(self.display, (EGL.EGLint * len(config_attributes))(*config_attributes),
+                            ctypes.pointer(config), 1, ctypes.pointer(num_configs))
+
+        if (num_configs.value < 1):
+            raise RuntimeError('No EGL config supports offscreen OpenGL rendering.')
+
+        surface_attributes = [EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE]
+        self.surface = EGL.eglCreatePbufferSurface(self.display, config,
+                                                   (EGL.EGLint * len(surface_attributes))(*surface_attributes))
+        #desktop OpenGL, the shaders need a compatibility context like the one wx creates
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+
+        if (not EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context)):
+            raise RuntimeError('Failed to make the EGL context current.')
+
+    def _create_osmesa(self) -> None:
+        from OpenGL import osmesa, arrays
+
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+
+        if (not self.context):
+            raise RuntimeError('Failed to create the OSMesa context.')
+
+        self.buffer = arrays.GLubyteArray.zeros((1, 1, 4))
+
+        if (not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, 1, 1)):
+            raise RuntimeError('Failed to make the OSMesa context current.')
+
+    def delete(self) -> None:
+        if (self.backend == 'osmesa'):
+            from OpenGL import osmesa
+
+            osmesa.OSMesaDestroyContext(self.context)
+        else:
+            from OpenGL import EGL
+
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroySurface(self.display, self.surface)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglTerminate(self.display)
+
+#a framebuffer with a color and depth renderbuffer of any size the driver supports, used instead of a
+#window's back buffer. While it is bound, glReadPixels reads from it
+class OffscreenFramebuffer():
+    def __init__(self, width : int, height : int) -> None:
+        max_size = glGetIntegerv(GL_MAX_RENDERBUFFER_SIZE)
+
+        if (width > max_size or height > max_size):
+            raise ValueError(f'{width}x{height} is larger than the largest renderbuffer ({max_size}).')
+
+        self.width = width
+        self.height = height
+
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        self.renderbuffers = []
+
+        for attachment, internal_format in [(GL_COLOR_ATTACHMENT0, GL_RGBA8), (GL_DEPTH_ATTACHMENT, GL_DEPTH_COMPONENT24)]:
+            renderbuffer = glGenRenderbuffers(1)
+            glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, internal_format, width, height)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer)
+            self.renderbuffers.append(renderbuffer)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        if (glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE):
+            raise RuntimeError('The offscreen framebuffer is incomplete.')
+
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def bind(self) -> None:
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glDrawBuffer(GL_COLOR_ATTACHMENT0)
+        glReadBuffer(GL_COLOR_ATTACHMENT0)
+        glViewport(0, 0, self.width, self.height)
+
+    def delete(self) -> None:
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glDeleteFramebuffers(1, self.fbo)
+        [glDeleteRenderbuffers(1, renderbuffer) for renderbuffer in self.renderbuffers]
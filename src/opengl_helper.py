@@ -4,12 +4,21 @@ from OpenGL.GLU import *
 from src.shaders import Shader
 from src.camera import Camera
 from src.objects import Object
+from src.satellite_projection import SatelliteProjection
+from src.texture_streamer import TextureStreamer
+from src.pyramid_streamer import PyramidStreamer
+from src.tile_pyramid import TilePyramid
+from src.texture_cache import texture_cache
+from src.decoded_cache import decoded_cache
+from src.blend_accumulator import BlendAccumulator
+from src.playback import Playback
+from src.frame_capture import FrameCapture
+from src.composite_recipes import CompositeRecipe, satellite_sensors
 
 import numpy as np
+import ctypes
 import os
 
-from PIL import Image
-
 #this cleans up the code in my GLWidget class and allows
 #the widgets to load faster. The user then specifies the objects and images they want to load
 
@@ -25,37 +34,297 @@ class GLInstance():
         self.camera = Camera(45.0, self.w / self.h)
         self.satellites = {}
 
+        #store time series as array textures so the slider only changes the 'layer' uniform
+        self.use_texture_arrays = True
+        #decode and upload selected images in the background instead of blocking the UI thread
+        self.stream_textures = True
+        self.streamer = TextureStreamer()
+        #textures that are no longer displayed stay on the GPU until this much texture memory is in use
+        self.vram_budget = 2 * 1024**3
+        #keep decoded frames next to the images and memory map them on later loads (uses a lot of disk space)
+        self.cache_decoded_frames = False
+        #the mesh level of detail is chosen so its error stays below this many pixels on the screen
+        self.lod_pixel_error = 0.5
+        #compute the texture coordinates from the satellites' geos projection in the fragment shader instead
+        #of using the precomputed per vertex coordinates
+        self.shader_projection = True
+        #blend overlapping satellites and fade their limbs on the GPU (needs shader_projection). Only for frames
+        #processed without alpha masks and blending (raw_frames), or the limbs and overlaps are faded twice
+        self.gpu_blending = False
+        self.accumulator = BlendAccumulator()
+        #higher values make the satellite with the better view dominate the overlaps more
+        self.blend_sharpness = 8.0
+        #viewing zenith angles (degrees) where the limb fade starts and where it reaches zero
+        self.limb_zenith = (70.0, 85.0)
+        #frames with a tile pyramid (see PyramidBuilder) only stream the tiles visible at the current zoom
+        #into a fixed size atlas (needs shader_projection)
+        self.use_tile_pyramids = True
+        self.pyramid_streamer = PyramidStreamer()
+        #the playhead of the time series, and how many frames of a longer series are kept on the GPU around it
+        self.playback = Playback()
+        #positions that replace the playhead for single satellites, timelapses use them to show each
+        #satellite's image of a timestamp
+        self.satellite_positions = {}
+        self.playback_ring_size = 16
+        #captured frames are read back asynchronously and saved by background writers
+        self.frame_capture = FrameCapture()
+        #the composite drawn when band images are selected, unless another one was chosen for the satellite
+        self.default_recipe = 'natural_color_raw'
+        self.selected_recipes = {}
+
+    #the texture cache is process wide, a new budget evicts textures right away if it is lower
+    @property
+    def vram_budget(self) -> int:
+        return texture_cache.budget_bytes
+
+    @vram_budget.setter
+    def vram_budget(self, budget_bytes : int) -> None:
+        texture_cache.set_budget(budget_bytes)
+
+    #the decoded frame cache is process wide, so the option is forwarded to it whenever it changes
+    @property
+    def cache_decoded_frames(self) -> bool:
+        return decoded_cache.enabled
+
+    @cache_decoded_frames.setter
+    def cache_decoded_frames(self, enabled : bool) -> None:
+        decoded_cache.enabled = enabled
+
     def load_satellite(self, satellite : str) -> None:
-        object = Object(satellite)
+        projection = SatelliteProjection.get(satellite) if self.shader_projection else None
+        object = Object(satellite, projection)
         self.satellites[satellite] = object
 
+    #the object's textures are released to the texture cache and its mesh buffers are deleted, so satellites
+    #that were toggled off don't keep their textures from being evicted
     def remove_satellite(self, satellite : str) -> None:
         try:
-            self.satellites.pop(satellite)
+            object = self.satellites.pop(satellite)
         except:
             print(f'Object {satellite} is not loaded.')
-            pass
+            return
+
+        object.delete()
+        self.satellite_positions.pop(satellite, None)
 
     def load_texture_images(self, satellite : str, images : list) -> None:
-        self.satellites[satellite].load_textures(images)
+        object = self.satellites[satellite]
+
+        #raw band images are drawn through a composite recipe instead of directly
+        if (images and all(CompositeRecipe.is_band_file(image) for image in images)):
+            object.band_files = CompositeRecipe.group_band_files(images)
+            self.set_composite_recipe(satellite, self.selected_recipes.get(satellite, self.default_recipe))
+            return
+
+        object.band_files = {}
+        object.recipe = None
+
+        if (self._has_pyramids(object, images)):
+            object.load_pyramid_textures(images, self.pyramid_streamer)
+            return
+
+        streamer = self.streamer if self.stream_textures else None
+        object.load_textures(images, self.use_texture_arrays, streamer, self.playback_ring_size)
+
+    def _has_pyramids(self, object : Object, images : list) -> bool:
+        if (not images or not self.use_tile_pyramids or object.projection is None):
+            return False
+
+        pyramids = [TilePyramid.load(image) for image in images]
+
+        return all(pyramid is not None and pyramid.tile_size == self.pyramid_streamer.tile_size for pyramid in pyramids)
+
+    #switch the composite computed from the satellite's band images. The bands of every timestamp are packed
+    #into one texture per recipe, and textures of recipes that were shown before are still in the texture cache
+    def set_composite_recipe(self, satellite : str, recipe_name : str) -> bool:
+        object = self.satellites[satellite]
+        recipe = CompositeRecipe.get(recipe_name)
+
+        if (recipe is None or satellite not in satellite_sensors):
+            print(f'{recipe_name} can not be computed in the shader for {satellite}.')
+            return False
+
+        #a recipe chosen before the band images are selected is used once they are
+        self.selected_recipes[satellite] = recipe_name
+
+        if (not object.band_files):
+            print(f'Select band images of {satellite} to draw {recipe_name}.')
+            return False
+
+        bands = recipe.get_bands(satellite_sensors[satellite])
+        files = [tuple(group[band] for band in bands) for timestamp, group in sorted(object.band_files.items())
+                 if all(band in group for band in bands)]
+
+        if (not files):
+            print(f'No band images found for {recipe_name}.')
+            return False
+
+        #the images may already have been removed (e.g. when new band images were selected)
+        if (not object.image_textures.deleted):
+            object.clear_images()
+
+        object.recipe = recipe
+        streamer = self.streamer if self.stream_textures else None
+        object.load_textures(files, self.use_texture_arrays, streamer, self.playback_ring_size)
+
+        return True
+
+    #upload streamed texture data for at most budget seconds, returns True if new frames became available
+    def stream_textures_step(self, budget : float=0.008) -> bool:
+        uploaded = self.streamer.pump(budget)
+
+        return self.pyramid_streamer.pump(budget) or uploaded
+
+    def is_streaming_idle(self) -> bool:
+        return self.streamer.is_idle() and self.pyramid_streamer.is_idle()
+
+    #wait for every streamed texture (and requested pyramid tile) to be uploaded, or only until ready() is True
+    def finish_texture_streaming(self, ready=None) -> None:
+        self.streamer.finish(ready)
+        self.pyramid_streamer.finish()
+
+    #the length of the longest loaded time series
+    def get_num_frames(self) -> int:
+        return max([object.num_layers for object in self.satellites.values()] + [1])
 
     #remove the active texture images
     def remove_texture_images(self, satellite : str) -> None:
         self.satellites[satellite].clear_images()
 
-    def capture_image(self, width, height, timelapse_counter, image_index, project_folder) -> None:
-        os.makedirs(project_folder + f'/images/timelapses/timelapse_{timelapse_counter}', exist_ok=True)
+    #draw every satellite with its texture at the given (fractional) playback position. The program and the per frame
+    #uniforms are set once, the per satellite uniforms once per satellite, and each tile only binds its
+    #vertex array and texture before drawing. With gpu_blending, the satellites drawn with the geos
+    #projection are accumulated into the blending framebuffer and resolved over the scene at the end
+    def render(self, position : float, elapsed : float) -> None:
+        shader = self.shaders
+        glUseProgram(shader.program)
+        self.camera.set_uniforms(shader)
+
+        glUniform1f(shader.get_uniform_location("time"), elapsed)
+        glUniform1i(shader.get_uniform_location("image"), 0)
+        glUniform1i(shader.get_uniform_location("imageArray"), 1)
+        self.pyramid_streamer.begin_frame()
+
+        blended = [satellite for satellite in self.satellites
+                   if self.gpu_blending and self.satellites[satellite].projection is not None]
+
+        if (blended):
+            self.accumulator.begin(self.w, self.h)
+            glUniform1i(shader.get_uniform_location("accumulate"), True)
+            glUniform1f(shader.get_uniform_location("blendSharpness"), self.blend_sharpness)
+            glUniform2f(shader.get_uniform_location("limbZenith"), np.cos(np.radians(self.limb_zenith[0])),
+                        np.cos(np.radians(self.limb_zenith[1])))
+
+            for satellite in blended:
+                self._draw_satellite(self.satellites[satellite], self.satellite_positions.get(satellite, position))
+
+            self.accumulator.end()
+
+        glUniform1i(shader.get_uniform_location("accumulate"), False)
+
+        for satellite in self.satellites:
+            if (satellite not in blended):
+                self._draw_satellite(self.satellites[satellite], self.satellite_positions.get(satellite, position))
+
+        glBindVertexArray(0)
+        glActiveTexture(GL_TEXTURE3)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glActiveTexture(GL_TEXTURE2)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glUseProgram(0)
+
+        if (blended):
+            self.accumulator.resolve()
+
+    def _draw_satellite(self, object : Object, position : float) -> None:
+        shader = self.shaders
+        texture = object.image_textures
+        use_texture_array = texture.use_texture_array
+        position = min(position, object.num_layers - 1)
+
+        #a timelapse prefetches the satellites whose position it overrides itself
+        if (texture.is_ring and object.satellite not in self.satellite_positions):
+            texture.prefetch(position, self.playback.direction)
+
+        #streamed textures may not have every layer yet, so draw the closest one that is loaded
+        layers = texture.get_frame_layers(position)
+
+        if (layers is None):
+            return
 
-        #data = glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
-        #use glReadPixels but have the image be flipped
-        data = glReadPixels(0, 0, width, height, GL_RGBA, GL_UNSIGNED_BYTE)
-        image_array = np.frombuffer(data, dtype=np.uint8)
+        layer, next_layer, mix = layers
+
+        glUniform1i(shader.get_uniform_location("numLayers"), object.num_layers)
+        glUniform1i(shader.get_uniform_location("useTextureArray"), use_texture_array)
+        glUniform2f(shader.get_uniform_location("frameLayers"), layer, next_layer)
+        glUniform1f(shader.get_uniform_location("frameMix"), mix)
+        glUniform1i(shader.get_uniform_location("useGeosProjection"), object.projection is not None)
+        glUniform1i(shader.get_uniform_location("useRecipe"), object.recipe is not None)
+        glUniform1i(shader.get_uniform_location("usePyramid"), texture.is_pyramid)
+
+        if (object.recipe is not None):
+            object.recipe.set_uniforms(shader)
+
+        if (object.projection is not None):
+            object.projection.set_uniforms(shader)
+
+        #patches facing away from the camera or outside of the view volume are skipped
+        half_width, half_height = self.camera.get_view_extent()
+        pixels_per_unit = self.camera.get_pixels_per_unit(self.h)
+        mesh = object.select_level(pixels_per_unit, self.lod_pixel_error)
+        visible = mesh.get_visible_patches(self.camera.get_view_matrix(), half_width, half_height)
+
+        #pyramids are sampled from the streamer's atlas, which only holds the tiles requested here.
+        #array textures hold every layer of a tile, so only the layer uniforms depend on the playback position
+        if (texture.is_pyramid):
+            self.pyramid_streamer.update(texture, layer, mesh, visible, pixels_per_unit, object.projection)
+            self.pyramid_streamer.bind(shader, texture)
+            layer_textures = [None]
+            target = GL_TEXTURE_2D
+        elif (use_texture_array):
+            layer_textures = object.textures[0]
+            target = GL_TEXTURE_2D_ARRAY
+            glActiveTexture(GL_TEXTURE1)
+        else:
+            layer_textures = object.textures[layer]
+            target = GL_TEXTURE_2D
+            glActiveTexture(GL_TEXTURE0)
+
+        for i in range(len(layer_textures)):
+            ranges = mesh.get_draw_ranges(i, visible)
+
+            if (not ranges):
+                continue
+
+            glBindVertexArray(mesh.tile_vaos[i])
+
+            if (layer_textures[i] is not None):
+                glBindTexture(target, layer_textures[i])
+
+            if (object.projection is not None):
+                x_offset, y_offset, x_scale, y_scale = texture.get_tile_transform(i)
+                glUniform2f(shader.get_uniform_location("tileOffset"), x_offset, y_offset)
+                glUniform2f(shader.get_uniform_location("tileScale"), x_scale, y_scale)
+
+            #offsets into the index buffer are in bytes
+            for offset, count in ranges:
+                glDrawElements(GL_TRIANGLES, int(count), GL_UNSIGNED_INT, ctypes.c_void_p(int(offset) * 4))
+
+    #queue the frame for saving, the file may be written after this returns (see finish_capture)
+    def capture_image(self, width, height, timelapse_counter, image_index, project_folder) -> None:
+        folder = project_folder + f'/images/timelapses/timelapse_{timelapse_counter}'
+        os.makedirs(folder, exist_ok=True)
 
-        # Reshape the array to match the captured image dimensions and flip vertically
-        image_array = image_array.reshape(height, width, 4)
-        flipped_image_array = np.flipud(image_array)
+        self.frame_capture.capture(width, height, folder + f'/{image_index}.png')
 
-        # Convert the numpy array back to an image using PIL
-        flipped_image = Image.fromarray(flipped_image_array)
-        flipped_image.save(project_folder + f'/images/timelapses/timelapse_{timelapse_counter}/{image_index}.png')
+    #queue the frame for encoding into a VideoExport
+    def capture_video_frame(self, width, height, video) -> None:
+        self.frame_capture.capture(width, height, video)
 
+    #wait until every captured frame is saved
+    def finish_capture(self) -> None:
+        self.frame_capture.finish()
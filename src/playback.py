@@ -0,0 +1,42 @@
+import numpy as np
+
+#The playhead of the loaded time series. The position is a fractional frame index: its integer part is the
+#frame that is shown and its fractional part blends it with the next frame in the fragment shader. While
+#playing, the position moves rate frames per second in the play direction, and the ring textures (see
+#RingTexture) prefetch the frames ahead of it in that direction
+class Playback():
+    def __init__(self, rate : float=4.0, loop : bool=True) -> None:
+        self.position = 0.0
+        self.rate = rate
+        self.direction = 1      #1 plays forward, -1 backward
+        self.playing = False
+        self.loop = loop
+
+    def play(self, direction : int=None) -> None:
+        if (direction is not None):
+            self.direction = 1 if direction >= 0 else -1
+
+        self.playing = True
+
+    def pause(self) -> None:
+        self.playing = False
+
+    def seek(self, position : float) -> None:
+        self.position = float(position)
+
+    #move the playhead by delta seconds, returns True if it moved. Without loop, playback stops at the ends
+    def advance(self, delta : float, num_frames : int) -> bool:
+        if (not self.playing or num_frames < 2):
+            return False
+
+        position = self.position + self.rate * self.direction * delta
+
+        if (self.loop):
+            position = position % num_frames
+        elif (position <= 0.0 or position >= num_frames - 1):
+            position = float(np.clip(position, 0.0, num_frames - 1))
+            self.playing = False
+
+        self.position = position
+
+        return True
@@ -0,0 +1,277 @@
+from OpenGL.GL import *
+
+import numpy as np
+import time
+from collections import OrderedDict
+from concurrent.futures import wait
+
+from src.tile_pyramid import TilePyramid
+from src.texture_streamer import decoder_pool
+
+#Streams the tiles of the frame pyramids (see TilePyramid) that the camera can see into one fixed size
+#atlas texture, so the texture memory of a satellite doesn't depend on the resolution or the length of its
+#time series. Every frame, the finest level needed at the current zoom is chosen, the tiles under the
+#visible mesh patches are requested, and the decoded tiles are copied into free atlas slots by pump().
+#The least recently used slots are reused, except for the tiles that are needed for the current frame.
+#a page table texture per satellite tells the fragment shader in which slot each tile of each level is.
+#the coarsest level is always requested, so the shader can fall back to it while finer tiles stream in
+class PyramidStreamer():
+    def __init__(self, atlas_size : int=8192, tile_size : int=512) -> None:
+        self.atlas_size = atlas_size
+        self.tile_size = tile_size
+        self.atlas = None
+        self.slots_x = 0
+        self.slots_y = 0
+
+        self.resident = OrderedDict()   #tile key -> slot, in least recently used order
+        self.free_slots = []
+        self.requested = {}             #tile key -> future of the decoded tile
+        self.needed = set()             #the tiles used by the current frame, they are never evicted
+        self.page_tables = {}           #texture -> PageTable
+
+    def _allocate(self) -> None:
+        size = min(self.atlas_size, glGetIntegerv(GL_MAX_TEXTURE_SIZE))
+        self.slots_x = self.slots_y = size // self.tile_size
+
+        self.atlas = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.atlas)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.slots_x * self.tile_size, self.slots_y * self.tile_size,
+                     0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        #the tiles have a border, so linear filtering never reads the neighboring slots
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        self.free_slots = [(x, y) for y in range(self.slots_y) for x in range(self.slots_x)]
+
+    #the tiles needed by the previous frame may be evicted again once a new frame starts
+    def begin_frame(self) -> None:
+        self.needed = set()
+
+    def is_idle(self) -> bool:
+        return not self.requested
+
+    #the finest level whose texels aren't smaller than a screen pixel at the center of the disk. The disk
+    #spans the angle 2 * asin(1 / radius_g) seen from the satellite, and 2 world units on the screen
+    def get_level(self, pyramid : TilePyramid, projection, pixels_per_unit : float) -> int:
+        x_min, y_min, x_max, y_max = projection.angle_extent
+        disk_texels = pyramid.width * 2.0 * np.arcsin(1.0 / projection.radius_g) / (x_max - x_min)
+        texels_per_pixel = disk_texels / (2.0 * pixels_per_unit)
+
+        return int(np.clip(np.floor(np.log2(max(texels_per_pixel, 1e-6))), 0, pyramid.num_levels - 1))
+
+    #request the tiles of the texture's layer that the visible patches of the mesh level sample, and
+    #update the satellite's page table. Called once per frame and satellite while drawing
+    def update(self, texture, layer : int, mesh, visible : np.ndarray, pixels_per_unit : float, projection) -> None:
+        if (self.atlas is None):
+            self._allocate()
+
+        pyramid = texture.pyramids[layer]
+        level = self.get_level(pyramid, projection, pixels_per_unit)
+        #the shader's coordinates don't vary linearly across the triangles, so the bounds get the seam margin
+        margin = np.array([-1.0, -1.0, 1.0, 1.0]) * mesh.seam_texels / pyramid.width
+        bounds = mesh.patch_tex_bounds[visible] + margin
+        coarsest = pyramid.num_levels - 1
+        base = {(coarsest, tx, ty) for ty, tx in np.argwhere(pyramid.tile_masks[coarsest])}
+        tiles = self._get_visible_tiles(pyramid, level, bounds) | base
+
+        #tiles that don't fit next to the ones this frame already needs would be decoded and dropped every
+        #frame, so coarser levels are used until the visible tiles fit into the atlas
+        while (level < coarsest and len(tiles) + len(self.needed) > self.slots_x * self.slots_y):
+            level += 1
+            tiles = self._get_visible_tiles(pyramid, level, bounds) | base
+
+        for tile in tiles:
+            key = (pyramid.file,) + tile
+            self.needed.add(key)
+
+            if (key in self.resident):
+                self.resident.move_to_end(key)
+            elif (key not in self.requested):
+                self.requested[key] = decoder_pool.submit(pyramid.get_tile_file(*tile))
+
+        page_table = self.page_tables.get(texture)
+
+        if (page_table is None):
+            page_table = self.page_tables[texture] = PageTable(pyramid)
+
+        page_table.min_level = level
+        page_table.update(self, pyramid)
+
+    #the tiles of a level that overlap the texture coordinate bounds (u_min, v_min, u_max, v_max) of the
+    #visible patches and have any pixels
+    def _get_visible_tiles(self, pyramid : TilePyramid, level : int, bounds : np.ndarray) -> set:
+        info = pyramid.levels[level]
+        mask = pyramid.tile_masks[level]
+        tiles = set()
+        bounds = np.clip(bounds, 0.0, 1.0)
+
+        x_low = np.floor(bounds[:, 0] * info['width'] / pyramid.content).astype(np.int64)
+        y_low = np.floor(bounds[:, 1] * info['height'] / pyramid.content).astype(np.int64)
+        x_high = np.minimum(np.floor(bounds[:, 2] * info['width'] / pyramid.content).astype(np.int64), info['tiles_x'] - 1)
+        y_high = np.minimum(np.floor(bounds[:, 3] * info['height'] / pyramid.content).astype(np.int64), info['tiles_y'] - 1)
+
+        for x0, y0, x1, y1 in zip(x_low, y_low, x_high, y_high):
+            for ty in range(y0, y1 + 1):
+                for tx in range(x0, x1 + 1):
+                    if (mask[ty, tx]):
+                        tiles.add((level, tx, ty))
+
+        return tiles
+
+    #copy decoded tiles into the atlas until the time budget (in seconds) is used up. Must be called with the
+    #GL context current. Returns True if a tile became available
+    def pump(self, budget : float=0.008) -> bool:
+        start = time.perf_counter()
+        completed = False
+
+        for key, future in list(self.requested.items()):
+            if (time.perf_counter() - start >= budget):
+                break
+
+            if (not future.done()):
+                continue
+
+            del self.requested[key]
+            pixels = future.result()
+
+            if (pixels is None or self.atlas is None):
+                continue
+
+            slot = self._get_slot()
+
+            #every slot holds a tile the current frame needs, which update() avoids unless even the coarsest
+            #level doesn't fit. The tile is requested again by a later frame
+            if (slot is None):
+                continue
+
+            glBindTexture(GL_TEXTURE_2D, self.atlas)
+            glTexSubImage2D(GL_TEXTURE_2D, 0, slot[0] * self.tile_size, slot[1] * self.tile_size,
+                            self.tile_size, self.tile_size, GL_RGBA, GL_UNSIGNED_BYTE, np.ascontiguousarray(pixels))
+            glBindTexture(GL_TEXTURE_2D, 0)
+
+            self.resident[key] = slot
+            self._mark_dirty(key[0])
+            completed = True
+
+        return completed
+
+    #block until every requested tile has been decoded and copied into the atlas
+    def finish(self) -> None:
+        wait(list(self.requested.values()))
+        self.pump(float('inf'))
+
+    #a free slot, or the slot of the least recently used tile that isn't needed by the current frame
+    def _get_slot(self):
+        if (self.free_slots):
+            return self.free_slots.pop()
+
+        for key in self.resident:
+            if (key not in self.needed):
+                slot = self.resident.pop(key)
+                self._mark_dirty(key[0])
+                return slot
+
+        return None
+
+    def _mark_dirty(self, file : str) -> None:
+        for page_table in self.page_tables.values():
+            if (page_table.file == file):
+                page_table.dirty = True
+
+    def bind(self, shader, texture) -> None:
+        page_table = self.page_tables[texture]
+
+        glActiveTexture(GL_TEXTURE2)
+        glBindTexture(GL_TEXTURE_2D, self.atlas)
+        glActiveTexture(GL_TEXTURE3)
+        glBindTexture(GL_TEXTURE_2D, page_table.texture)
+        glActiveTexture(GL_TEXTURE0)
+
+        page_table.set_uniforms(shader)
+        glUniform1i(shader.get_uniform_location("pyramidAtlas"), 2)
+        glUniform1i(shader.get_uniform_location("pyramidPages"), 3)
+        glUniform1f(shader.get_uniform_location("pyramidTileSize"), self.tile_size)
+        glUniform2f(shader.get_uniform_location("pyramidAtlasSlots"), self.slots_x, self.slots_y)
+
+    #tiles that are still resident stay in the atlas until their slot is needed
+    def remove_texture(self, texture) -> None:
+        page_table = self.page_tables.pop(texture, None)
+
+        if (page_table is not None):
+            page_table.delete()
+
+    def delete(self) -> None:
+        [page_table.delete() for page_table in self.page_tables.values()]
+        self.page_tables = {}
+        self.requested = {}
+        self.resident = OrderedDict()
+
+        if (self.atlas is not None):
+            glDeleteTextures(1, self.atlas)
+            self.atlas = None
+
+#The atlas slot of every tile of one frame's pyramid. The levels are stacked vertically in a small RGBA8
+#texture, one texel per tile holding the slot's x and y, and 255 in blue when the tile is in the atlas.
+#it is rebuilt when the satellite switches to another frame or the frame's tiles move in or out of the atlas
+class PageTable():
+    def __init__(self, pyramid : TilePyramid) -> None:
+        self.texture = glGenTextures(1)
+        self.file = None
+        self.dirty = True
+        self.min_level = 0
+        self._set_pyramid(pyramid)
+
+    def _set_pyramid(self, pyramid : TilePyramid) -> None:
+        self.file = pyramid.file
+        self.pyramid = pyramid
+        self.offsets = np.cumsum([0] + [level['tiles_y'] for level in pyramid.levels])
+        self.width = max(level['tiles_x'] for level in pyramid.levels)
+        self.height = int(self.offsets[-1])
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, self.width, self.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        self.dirty = True
+
+    def update(self, streamer : PyramidStreamer, pyramid : TilePyramid) -> None:
+        if (pyramid.file != self.file):
+            self._set_pyramid(pyramid)
+
+        if (not self.dirty):
+            return
+
+        pages = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+
+        for key, (x, y) in streamer.resident.items():
+            if (key[0] == self.file):
+                level, tx, ty = key[1:]
+                pages[self.offsets[level] + ty, tx] = (x, y, 255, 255)
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE, pages)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        self.dirty = False
+
+    def set_uniforms(self, shader) -> None:
+        pyramid = self.pyramid
+        levels = pyramid.num_levels
+
+        glUniform1i(shader.get_uniform_location("pyramidLevels"), levels)
+        glUniform1i(shader.get_uniform_location("pyramidMinLevel"), self.min_level)
+        glUniform2f(shader.get_uniform_location("pyramidSize"), pyramid.width, pyramid.height)
+        glUniform1f(shader.get_uniform_location("pyramidTileContent"), pyramid.content)
+        glUniform1f(shader.get_uniform_location("pyramidTileBorder"), pyramid.border)
+        glUniform2iv(shader.get_uniform_location("pyramidPageOffsets"), levels,
+                     np.array([(0, offset) for offset in self.offsets[:-1]], dtype=np.int32))
+        glUniform2iv(shader.get_uniform_location("pyramidPageSizes"), levels,
+                     np.array([(level['tiles_x'], level['tiles_y']) for level in pyramid.levels], dtype=np.int32))
+
+    def delete(self) -> None:
+        glDeleteTextures(1, self.texture)
@@ -0,0 +1,91 @@
+from OpenGL.GL import *
+
+import numpy as np
+
+#The geostationary (geos) projection of a satellite's images, as defined by PROJ. The fragment shader
+#evaluates it per pixel, so the satellites can be drawn on a coarse generated sphere without precomputed
+#texture coordinates. The parameters are those of the area definitions the images are resampled to
+#(see ImageProcessor._get_satpy_kwargs).
+class SatelliteProjection():
+    def __init__(self, lon_0 : float, h : float, a : float, b : float, sweep : str, area_extent : tuple) -> None:
+        self.lon_0 = lon_0              #sub satellite longitude in degrees
+        self.h = h                      #satellite height above the ellipsoid in meters
+        self.a = a                      #equatorial radius in meters
+        self.b = b                      #polar radius in meters
+        self.sweep = sweep              #'x' for GOES, 'y' for the other satellites
+        self.area_extent = area_extent  #(x_min, y_min, x_max, y_max) in projection meters
+
+        self.radius_g = 1.0 + h / a     #satellite distance from the earth's center in equatorial radii
+        self.radius_p = b / a
+        #the extent in scan angles, projection meters are the scan angle multiplied by h
+        self.angle_extent = tuple(value / h for value in area_extent)
+
+    def from_area_def(area_def):
+        params = area_def.crs.to_dict()
+        ellipsoid = area_def.crs.ellipsoid
+
+        return SatelliteProjection(params.get('lon_0', 0.0), params['h'], ellipsoid.semi_major_metre,
+                                   ellipsoid.semi_minor_metre, params.get('sweep', 'y'), tuple(area_def.area_extent))
+
+    #returns the projection of a satellite, or None if it is unknown
+    def get(satellite : str):
+        params = satellite_projections.get(satellite)
+
+        if (params is None):
+            return None
+
+        return SatelliteProjection(**params)
+
+    #returns the image texture coordinates of points on the sphere and whether the satellite can see them.
+    #points the satellite can't see still get (extrapolated) coordinates
+    def project(self, vertices : np.ndarray) -> tuple:
+        directions = vertices / np.linalg.norm(vertices, axis=1)[:, np.newaxis]
+        lon = np.arctan2(directions[:, 1], directions[:, 0]) - np.radians(self.lon_0)
+        lat = np.arcsin(np.clip(directions[:, 2], -1.0, 1.0))
+
+        rp2 = self.radius_p**2
+        lat_c = np.arctan(rp2 * np.tan(lat))
+        r = self.radius_p / np.hypot(self.radius_p * np.cos(lat_c), np.sin(lat_c))
+        vx = r * np.cos(lon) * np.cos(lat_c)
+        vy = r * np.sin(lon) * np.cos(lat_c)
+        vz = r * np.sin(lat_c)
+
+        visible = (self.radius_g - vx) * vx - vy**2 - vz**2 / rp2 >= 0.0
+        tmp = self.radius_g - vx
+
+        if (self.sweep == 'x'):
+            x, y = np.arctan(vy / np.hypot(vz, tmp)), np.arctan(vz / tmp)
+        else:
+            x, y = np.arctan(vy / tmp), np.arctan(vz / np.hypot(vy, tmp))
+
+        #the first row of the image is the top of the extent
+        x_min, y_min, x_max, y_max = self.angle_extent
+        tex_coords = np.column_stack(((x - x_min) / (x_max - x_min), (y_max - y) / (y_max - y_min)))
+
+        return tex_coords.astype(np.float32), visible
+
+    #the cosine of the angle between the sub satellite point and the edge of the satellite's view
+    def get_view_cap(self) -> tuple:
+        lon_0 = np.radians(self.lon_0)
+
+        return np.array([np.cos(lon_0), np.sin(lon_0), 0.0]), 1.0 / self.radius_g
+
+    def set_uniforms(self, shader) -> None:
+        glUniform1f(shader.get_uniform_location("geosLon0"), np.radians(self.lon_0))
+        glUniform1f(shader.get_uniform_location("geosRadiusG"), self.radius_g)
+        glUniform1f(shader.get_uniform_location("geosRadiusP"), self.radius_p)
+        glUniform1i(shader.get_uniform_location("geosSweepX"), self.sweep == 'x')
+        glUniform4f(shader.get_uniform_location("geosExtent"), *self.angle_extent)
+
+#parameters of the resample areas in data_processor.py
+_goes_extent = (-5434894.885056, -5434894.885056, 5434894.885056, 5434894.885056)
+_seviri_extent = (-5570248.686685662, -5567248.28340708, 5567248.28340708, 5570248.686685662)
+
+satellite_projections = {
+    'goes_east' : {'lon_0': -75.0, 'h': 35786023.0, 'a': 6378137.0, 'b': 6356752.31414, 'sweep': 'x', 'area_extent': _goes_extent},
+    'goes_west' : {'lon_0': -137.0, 'h': 35786023.0, 'a': 6378137.0, 'b': 6356752.31414, 'sweep': 'x', 'area_extent': _goes_extent},
+    'himawari' : {'lon_0': 140.7, 'h': 35785831.0, 'a': 6378137.0, 'b': 6356752.31414, 'sweep': 'y',
+                  'area_extent': (-5500000.0355, -5500000.0355, 5500000.0355, 5500000.0355)},
+    'meteosat_9' : {'lon_0': 45.5, 'h': 35785831.0, 'a': 6378169.0, 'b': 6356583.8, 'sweep': 'y', 'area_extent': _seviri_extent},
+    'meteosat_10' : {'lon_0': 0.0, 'h': 35785831.0, 'a': 6378169.0, 'b': 6356583.8, 'sweep': 'y', 'area_extent': _seviri_extent},
+}
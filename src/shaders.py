@@ -7,6 +7,7 @@ class Shader():
     def __init__(self, shader_kwargs=None) -> None:
         self.shader_kwargs = shader_kwargs
         self.shaders = []
+        self.uniform_locations = {}
 
     def load(self) -> None:
         self.program = glCreateProgram()
@@ -21,6 +22,7 @@ class Shader():
             self.shaders.append(shader)
     
         glLinkProgram(self.program)
+        self.uniform_locations = {}
 
         if glGetProgramiv(self.program, GL_LINK_STATUS) != GL_TRUE:
             raise RuntimeError(glGetProgramInfoLog(self.program))
@@ -29,6 +31,16 @@ class Shader():
             glDetachShader(self.program, shader)
             glDeleteShader(shader)
 
+    #uniform locations don't change after linking, so each one is only looked up once
+    def get_uniform_location(self, name : str) -> int:
+        location = self.uniform_locations.get(name)
+
+        if (location is None):
+            location = glGetUniformLocation(self.program, name)
+            self.uniform_locations[name] = location
+
+        return location
+
     #read the shader source file into an array of strings
     def _read_shader(self, shader_filepath) -> str:
         with open(shader_filepath, 'r') as f:
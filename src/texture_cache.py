@@ -0,0 +1,83 @@
+from OpenGL.GL import *
+
+from collections import OrderedDict
+
+#A process wide cache of GPU textures. Textures are keyed by (file, tile, mtime), or for array textures
+#by the tuples of files and mtimes of every layer, so images that are selected again, replayed, or shared
+#between satellites (like the default image) are uploaded only once. The cache keeps track of the texture
+#memory it holds and deletes the least recently used textures that are no longer referenced once it is
+#over its VRAM budget.
+class TextureCache():
+    def __init__(self, budget_bytes : int=2 * 1024**3) -> None:
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.entries = OrderedDict() #key -> CacheEntry, least recently used first
+
+    def set_budget(self, budget_bytes : int) -> None:
+        self.budget_bytes = budget_bytes
+        self._evict()
+
+    #returns (texture, complete) for the key and references it, or (None, False) if it isn't cached.
+    #an incomplete texture is still being uploaded by another user and can be shared, but its pixels
+    #have to be uploaded again to be sure they are there
+    def acquire(self, key) -> tuple:
+        entry = self.entries.get(key)
+
+        if (entry is None):
+            return None, False
+
+        self.entries.move_to_end(key)
+        entry.refs += 1
+
+        return entry.texture, entry.complete
+
+    #add a newly created texture, it is counted as referenced by the caller
+    def add(self, key, texture, nbytes : int) -> None:
+        self.entries[key] = CacheEntry(texture, nbytes)
+        self.used_bytes += nbytes
+        self._evict()
+
+    #called once all of the texture's pixels have been uploaded
+    def mark_complete(self, key) -> None:
+        if (key in self.entries):
+            self.entries[key].complete = True
+
+    def release(self, key) -> None:
+        entry = self.entries.get(key)
+
+        if (entry is None):
+            return
+
+        entry.refs -= 1
+
+        #a partially uploaded texture can never be reused
+        if (entry.refs <= 0 and not entry.complete):
+            self._delete(key)
+
+        self._evict()
+
+    def _evict(self) -> None:
+        for key in list(self.entries.keys()):
+            if (self.used_bytes <= self.budget_bytes):
+                break
+
+            if (self.entries[key].refs <= 0):
+                self._delete(key)
+
+    def _delete(self, key) -> None:
+        entry = self.entries.pop(key)
+        glDeleteTextures(1, entry.texture)
+        self.used_bytes -= entry.nbytes
+
+    def clear(self) -> None:
+        for key in list(self.entries.keys()):
+            self._delete(key)
+
+class CacheEntry():
+    def __init__(self, texture, nbytes : int) -> None:
+        self.texture = texture
+        self.nbytes = nbytes
+        self.refs = 1
+        self.complete = False
+
+texture_cache = TextureCache()
@@ -0,0 +1,228 @@
+from OpenGL.GL import *
+
+import numpy as np
+import ctypes
+import time
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from PIL import Image
+Image.MAX_IMAGE_PIXELS = None #disable PIL preventing large image loading
+
+from src.composite_recipes import BandEncoding
+from src.decoded_cache import decoded_cache
+
+#Streams texture images to the GPU without blocking the UI thread. Images are decoded into numpy
+#buffers by the decoder pool, and the GL thread uploads them through pixel buffer objects in small
+#time slices by calling pump() once per frame. Frames are uploaded in the order they were submitted
+#(timestamp order), and textures become drawable layer by layer as they arrive.
+class TextureStreamer():
+    def __init__(self, num_pbos : int=2, max_in_flight : int=None) -> None:
+        self.lock = Lock()
+        self.pending = 0        #number of submitted layers that haven't been uploaded or dropped yet
+
+        #at most max_in_flight frames are decoded ahead of the upload, so they don't pile up in memory
+        self.max_in_flight = max_in_flight or decoder_pool.workers * 2
+        self.waiting = deque()      #(texture, layer, file) that haven't been given to the decoder pool yet
+        self.in_flight = deque()    #(texture, layer, future) in submission order
+
+        #the layer that is currently being uploaded tile by tile
+        self.current = None
+        self.current_tile = 0
+
+        self.num_pbos = num_pbos
+        self.pbos = None
+        self.pbo_index = 0
+
+    def submit(self, texture, layer : int, file) -> None:
+        with self.lock:
+            self.pending += 1
+
+        self.waiting.append((texture, layer, file))
+        self._fill_pool()
+
+    def is_idle(self) -> bool:
+        return self.pending == 0
+
+    def _finish_job(self) -> None:
+        with self.lock:
+            self.pending -= 1
+
+    def _fill_pool(self) -> None:
+        while (self.waiting and len(self.in_flight) < self.max_in_flight):
+            texture, layer, file = self.waiting.popleft()
+
+            #the texture was removed (or doesn't want the frame anymore) before we got to it
+            if (not texture.wants_layer(layer)):
+                self._finish_job()
+                continue
+
+            self.in_flight.append((texture, layer, decoder_pool.submit(file)))
+
+    #make the next decoded frame (in submission order) the current one. Without wait, returns False if
+    #it isn't decoded yet
+    def _next_decoded(self, wait : bool) -> bool:
+        self._fill_pool()
+
+        while (self.in_flight):
+            texture, layer, future = self.in_flight[0]
+
+            if (not wait and not future.done()):
+                return False
+
+            image = future.result()
+            self.in_flight.popleft()
+            self._fill_pool()
+
+            #failed to decode, or the texture was removed while it was decoded
+            if (image is None or not texture.wants_layer(layer)):
+                self._finish_job()
+                continue
+
+            self.current = (texture, layer, image)
+            self.current_tile = 0
+
+            return True
+
+        return False
+
+    #upload decoded layers until the time budget (in seconds) is used up. Must be called with the GL context
+    #current. Returns True if at least one layer became available
+    def pump(self, budget : float=0.008) -> bool:
+        start = time.perf_counter()
+        completed = False
+
+        while (time.perf_counter() - start < budget):
+            if (self.current is None and not self._next_decoded(False)):
+                break
+
+            completed = self._upload_next_tile() or completed
+
+        return completed
+
+    #block until every submitted layer has been uploaded, used when the frames are needed right away. With
+    #ready, stops as soon as it returns True, and the later layers keep decoding in the background
+    def finish(self, ready=None) -> None:
+        while (not self.is_idle() and (ready is None or not ready())):
+            if (self.current is None and not self._next_decoded(True)):
+                break
+
+            self._upload_next_tile()
+
+    #upload one tile of the current layer, returns True when the whole layer has been uploaded
+    def _upload_next_tile(self) -> bool:
+        texture, layer, image = self.current
+
+        if (not texture.wants_layer(layer)):
+            self.current = None
+            self._finish_job()
+            return False
+
+        self._upload_through_pbo(texture, layer, self.current_tile, image)
+        self.current_tile += 1
+
+        if (self.current_tile < texture.num_tiles):
+            return False
+
+        texture.mark_layer_loaded(layer)
+        #release the CPU side copy of the image
+        self.current = None
+        self._finish_job()
+
+        return True
+
+    #the tile is copied from the decoded frame straight into the mapped buffer, without an intermediate copy
+    def _upload_through_pbo(self, texture, layer : int, tile : int, image : np.ndarray) -> None:
+        if (self.pbos is None):
+            self.pbos = [glGenBuffers(1) for i in range(self.num_pbos)]
+
+        #alternate between the buffers so the driver can still be reading from the previous one
+        pbo = self.pbos[self.pbo_index]
+        self.pbo_index = (self.pbo_index + 1) % self.num_pbos
+
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pbo)
+        #orphan the old storage so mapping doesn't wait for a pending transfer
+        x, y = texture.get_tile_origin(tile)
+        shape = (texture.tile_height, texture.tile_width, 4)
+        nbytes = shape[0] * shape[1] * shape[2]
+
+        glBufferData(GL_PIXEL_UNPACK_BUFFER, nbytes, None, GL_STREAM_DRAW)
+        pointer = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, nbytes, GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT)
+        mapped = np.ctypeslib.as_array(ctypes.cast(pointer, ctypes.POINTER(ctypes.c_uint8)), shape=shape)
+        mapped[:] = image[y:y + shape[0], x:x + shape[1]]
+        glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+
+        #with a pixel unpack buffer bound, the pixel pointer is an offset into the buffer
+        texture.upload_tile(layer, tile, None)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+    def delete(self) -> None:
+        if (self.pbos is not None):
+            [glDeleteBuffers(1, pbo) for pbo in self.pbos]
+            self.pbos = None
+
+#decodes image files into RGBA numpy arrays
+#frames in the decoded cache are memory mapped instead of decoded
+class Decoder():
+    def decode(file) -> np.ndarray:
+        image = decoded_cache.load(file)
+
+        if (image is None):
+            image = Decoder._decode_file(file)
+            decoded_cache.save(file, image)
+
+        return image
+
+    def _decode_file(file) -> np.ndarray:
+        #band files of a composite recipe are packed into the channels of one image
+        if (isinstance(file, tuple)):
+            return np.asarray(BandEncoding.merge(file))
+
+        with Image.open(file) as image:
+            if (image.mode != 'RGBA'):
+                image = image.convert('RGBA')
+
+            return np.asarray(image)
+
+#decodes several frames at once on worker threads. PNG inflating (zlib) releases the GIL, so the decodes
+#really run in parallel
+class DecoderPool():
+    def __init__(self, workers : int=None) -> None:
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='texture-decoder')
+
+    #returns a future of the decoded frame, or of None if it couldn't be decoded
+    def submit(self, file):
+        return self.executor.submit(DecoderPool._decode, file)
+
+    def _decode(file):
+        try:
+            return Decoder.decode(file)
+        except Exception as e:
+            print(f'Failed to decode {file}.')
+            print(e)
+            return None
+
+    #yields the decoded frames in the order of the files, while the following ones are decoded in the background
+    def decode_ordered(self, files : list, max_in_flight : int=None):
+        max_in_flight = max_in_flight or self.workers * 2
+        in_flight = deque()
+        files = iter(files)
+
+        for file in files:
+            in_flight.append(self.submit(file))
+
+            if (len(in_flight) >= max_in_flight):
+                break
+
+        while (in_flight):
+            image = in_flight.popleft().result()
+
+            for file in files:
+                in_flight.append(self.submit(file))
+                break
+
+            yield image
+
+decoder_pool = DecoderPool()
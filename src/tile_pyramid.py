@@ -0,0 +1,137 @@
+import numpy as np
+import os
+import sys
+import json
+from glob import glob
+from PIL import Image
+Image.MAX_IMAGE_PIXELS = None #disable PIL preventing large image loading
+
+from tqdm import tqdm
+
+#A multiresolution tile pyramid of a processed frame. Level 0 is the full resolution image and every
+#following level halves it, until the whole image fits in one tile. Each tile holds tile_size - 2 * border
+#pixels of content plus a border copied from its neighbors, so it can be filtered on its own. Tiles
+#without any opaque pixel (space around the disk) aren't written. The pyramid of images/x/frame.png is
+#stored in images/x/.pyramid/frame.png/ as {level}/{tx}_{ty}.png plus a pyramid.json description,
+#which is written last and records the source's mtime and size so stale pyramids are ignored
+class TilePyramid():
+    def __init__(self, file : str, info : dict) -> None:
+        self.file = file
+        self.folder = TilePyramid.get_folder(file)
+        self.width = info['width']
+        self.height = info['height']
+        self.tile_size = info['tile_size']
+        self.border = info['border']
+        self.content = self.tile_size - 2 * self.border
+        self.levels = info['levels']
+        self.num_levels = len(self.levels)
+
+        #which tiles of each level have pixels, as (tiles_y, tiles_x) masks
+        self.tile_masks = []
+
+        for level in self.levels:
+            mask = np.zeros((level['tiles_y'], level['tiles_x']), dtype=bool)
+
+            for tx, ty in level['tiles']:
+                mask[ty, tx] = True
+
+            self.tile_masks.append(mask)
+
+    def get_folder(file : str) -> str:
+        return os.path.join(os.path.dirname(os.path.abspath(file)), '.pyramid', os.path.basename(file))
+
+    def _get_source_info(file : str) -> list:
+        return [os.path.getmtime(file), os.path.getsize(file)]
+
+    #returns the pyramid of a frame, or None if it wasn't built or the frame changed since
+    def load(file):
+        if (not isinstance(file, str)):
+            return None
+
+        try:
+            with open(os.path.join(TilePyramid.get_folder(file), 'pyramid.json'), 'r') as f:
+                info = json.load(f)
+
+            if (info['source'] != TilePyramid._get_source_info(file)):
+                return None
+
+            return TilePyramid(file, info)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def get_tile_file(self, level : int, tx : int, ty : int) -> str:
+        return os.path.join(self.folder, str(level), f'{tx}_{ty}.png')
+
+    def has_tile(self, level : int, tx : int, ty : int) -> bool:
+        return bool(self.tile_masks[level][ty, tx])
+
+class PyramidBuilder():
+    def __init__(self, tile_size : int=512, border : int=1) -> None:
+        self.tile_size = tile_size
+        self.border = border
+        self.content = tile_size - 2 * border
+
+    def build(self, file : str) -> None:
+        folder = TilePyramid.get_folder(file)
+        levels = []
+
+        with Image.open(file) as image:
+            current = image.convert('RGBA') if image.mode != 'RGBA' else image.copy()
+
+        width, height = current.size
+
+        while True:
+            levels.append(self._write_level(current, os.path.join(folder, str(len(levels)))))
+
+            if (max(current.size) <= self.content):
+                break
+
+            current = current.reduce(2)
+
+        info = {'source': TilePyramid._get_source_info(file), 'width': width, 'height': height,
+                'tile_size': self.tile_size, 'border': self.border, 'levels': levels}
+
+        with open(os.path.join(folder, 'pyramid.json.partial'), 'w') as f:
+            json.dump(info, f)
+
+        os.replace(os.path.join(folder, 'pyramid.json.partial'), os.path.join(folder, 'pyramid.json'))
+
+    def _write_level(self, image : Image.Image, folder : str) -> dict:
+        os.makedirs(folder, exist_ok=True)
+        pixels = np.asarray(image)
+        height, width = pixels.shape[:2]
+        tiles_x = -(-width // self.content)
+        tiles_y = -(-height // self.content)
+        b, c = self.border, self.content
+
+        #edge padding gives the outer tiles their border and fills the last partial tiles
+        padded = np.pad(pixels, ((b, tiles_y * c - height + b), (b, tiles_x * c - width + b), (0, 0)), mode='edge')
+        tiles = []
+
+        for ty in range(tiles_y):
+            for tx in range(tiles_x):
+                tile = padded[ty * c:ty * c + self.tile_size, tx * c:tx * c + self.tile_size]
+
+                if (tile[:, :, 3].max() == 0):
+                    continue
+
+                Image.fromarray(tile).save(os.path.join(folder, f'{tx}_{ty}.png'))
+                tiles.append([tx, ty])
+
+        return {'width': width, 'height': height, 'tiles_x': tiles_x, 'tiles_y': tiles_y, 'tiles': tiles}
+
+    #build the pyramids of every processed frame in a folder (recursively) that doesn't have an up to date one
+    def build_folder(self, folder : str) -> None:
+        files = [file for file in glob(os.path.join(folder, '**', '*.png'), recursive=True)
+                 if '.pyramid' not in file and '.decoded' not in file]
+        files = [file for file in files if TilePyramid.load(file) is None]
+
+        for file in tqdm(files, desc='Building tile pyramids...'):
+            try:
+                self.build(file)
+            except Exception as e:
+                print(f'Failed to build the tile pyramid of {file}.')
+                print(e)
+
+if __name__ == '__main__':
+    PyramidBuilder().build_folder(sys.argv[1] if len(sys.argv) > 1 else 'images/')
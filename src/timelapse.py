@@ -0,0 +1,173 @@
+from glob import glob
+from datetime import datetime
+import os
+
+from src.video_export import VideoExport
+
+#Renders a timelapse of the processed images of several satellites, one frame per timestamp. It only needs a
+#GLInstance and a function that draws the scene into the current framebuffer, so the same frames come out
+#of the viewer's window (OpenGLCanvas) and of the headless renderer (render_timelapse.py).
+#each satellite's images are loaded once as a time series (or the loaded one is kept if it already holds
+#them), and every frame only moves the satellites' positions in it. The streamer keeps decoding the next
+#frames while the current one is drawn and read back. The time series selected before are set aside while
+#rendering and drawn again afterwards, so the slider keeps showing the selected images
+class Timelapse():
+    def __init__(self, gl, satellites : list, project_folder : str, resolution : str, prefer_blend_images : bool=False) -> None:
+        self.gl = gl
+        self.satellites = satellites
+        self.project_folder = project_folder
+        self.resolution = resolution
+        self.image_groups = self._get_image_groups(prefer_blend_images)
+        self.stashed = {}   #satellite -> the textures it had before the timelapse replaced them
+
+    #the images of every satellite grouped by timestamp, in timestamp order
+    def _get_image_groups(self, prefer_blend_images : bool) -> list:
+        timestamp_format = '%Y%m%d_%H%M'
+        image_files = []
+
+        for satellite in self.satellites:
+            path = self.project_folder + f'/images/{satellite}/{self.resolution}/'
+
+            if (prefer_blend_images):
+                images = glob(path + 'blended*.png')
+            else:
+                images = glob(path + '*.png')
+                images = [i for i in images if 'blended' not in i and '_band_' not in i]
+
+            image_files.extend(images)
+
+        timestamps = []
+
+        for file in image_files:
+            date_str = file.split('_')[-2:]
+            date_str = str(date_str[0] + '_' + date_str[1]).split('.')[0]
+            date = datetime.strptime(date_str, timestamp_format)
+            timestamps.append(date)
+
+        timestamps = sorted(timestamps) #sort the timestamps and convert them to a string so we can sort the image files
+        ts_str = [date.strftime(timestamp_format) for date in timestamps]
+        ts_str = list(dict.fromkeys(ts_str)) #remove duplicates
+        image_groups = []
+
+        for timestamp in ts_str:
+            group = [i for i in image_files if timestamp in i]
+            image_groups.append(tuple(group))
+
+        return image_groups
+
+    #every satellite's images over the whole timelapse
+    def _get_satellite_images(self) -> dict:
+        satellite_images = {satellite: [] for satellite in self.satellites}
+
+        for group in self.image_groups:
+            for image in group:
+                for satellite in self.satellites:
+                    if satellite in image:
+                        satellite_images[satellite].append(image)
+
+        return satellite_images
+
+    #satellites whose texture already holds every image (e.g. the time series selected for the slider) keep
+    #it, the others load their images as one time series next to the selected one. Returns the layer of each
+    #image per satellite
+    def _load_series(self) -> dict:
+        layers = {}
+
+        for satellite, images in self._get_satellite_images().items():
+            if (not images or satellite not in self.gl.satellites):
+                continue
+
+            files = self.gl.satellites[satellite].image_textures.files
+
+            if (not {os.path.abspath(image) for image in images} <= {os.path.abspath(file) for file in files if isinstance(file, str)}):
+                self.stashed[satellite] = self.gl.satellites[satellite].stash_textures()
+                self.gl.load_texture_images(satellite, images)
+                files = self.gl.satellites[satellite].image_textures.files
+
+            layers[satellite] = {os.path.abspath(file): layer for layer, file in enumerate(files) if isinstance(file, str)}
+
+        return layers
+
+    #a satellite without an image in the group keeps showing its previous one
+    def _set_positions(self, group : tuple, layers : dict) -> None:
+        for image in group:
+            for satellite in layers:
+                if satellite in image:
+                    position = layers[satellite][os.path.abspath(image)]
+                    self.gl.satellite_positions[satellite] = float(position)
+                    texture = self.gl.satellites[satellite].image_textures
+
+                    #start streaming the frame (and the ones after it) before the frame is drawn. The
+                    #timelapse only moves forward, drawing doesn't prefetch overridden positions again
+                    if (texture.is_ring):
+                        texture.prefetch(position, 1)
+
+    #delete the timelapse's time series and draw the selected ones again
+    def _restore_series(self) -> None:
+        for satellite, stashed in self.stashed.items():
+            if (satellite in self.gl.satellites):
+                self.gl.satellites[satellite].restore_textures(stashed)
+
+        self.stashed = {}
+
+    #whether every satellite's frame is on the GPU
+    def _is_ready(self) -> bool:
+        for satellite, position in self.gl.satellite_positions.items():
+            layer = int(position)
+
+            if (self.gl.satellites[satellite].image_textures.get_loaded_layer(layer) != layer):
+                return False
+
+        return True
+
+    #only the layers of this frame are waited for. Drawing can request pyramid tiles that aren't on the GPU
+    #yet, so the frame is drawn again once they arrived (a few times at most, in case the atlas can't hold
+    #every visible tile)
+    def _paint_frame(self, paint, max_passes : int=4) -> None:
+        for i in range(max_passes):
+            self.gl.finish_texture_streaming(self._is_ready)
+            paint()
+
+            if (self._is_ready() and self.gl.pyramid_streamer.is_idle()):
+                break
+
+    #paint draws the scene into the framebuffer that is read back, width and height are its size. With video
+    #({'frame_rate', 'fps', 'blend'}, see VideoExport), the frames are encoded into timelapse_N.mp4 instead of
+    #being saved as PNGs in the timelapse_N folder
+    def render(self, paint, width : int, height : int, timelapse_counter : int, video : dict=None) -> None:
+        export = None
+
+        if (video is not None):
+            file = self.project_folder + f'/images/timelapses/timelapse_{timelapse_counter}.mp4'
+
+            try:
+                export = VideoExport(file, width, height, **video)
+            except Exception as e:
+                print('Failed to start the video encoder, saving the frames as images instead.')
+                print(e)
+
+        try:
+            layers = self._load_series()
+
+            for i in range(len(self.image_groups)):
+                self._set_positions(self.image_groups[i], layers)
+                self._paint_frame(paint)
+
+                if (export is not None):
+                    self.gl.capture_video_frame(width, height, export)
+                else:
+                    self.gl.capture_image(width, height, timelapse_counter, i, self.project_folder)
+        finally:
+            #the viewer gets its time series back and the encoder is closed even if a frame failed
+            try:
+                #the last frames are still being read back and encoded
+                self.gl.finish_capture()
+            except Exception as e:
+                print('Failed to finish capturing the timelapse.')
+                print(e)
+
+            self.gl.satellite_positions = {}
+            self._restore_series()
+
+            if (export is not None):
+                export.close()
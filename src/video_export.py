@@ -0,0 +1,118 @@
+import numpy as np
+import os
+import shutil
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+#Encodes captured frames straight into a video file, instead of saving every frame as a PNG first. The raw
+#RGBA frames (bottom row first, as glReadPixels returns them) are piped into a local ffmpeg process. If
+#ffmpeg isn't installed, OpenCV's VideoWriter (already a dependency) is used instead of a pure Python encoder,
+#and the in between frames are blended here. frame_rate is how many captured frames are shown per second,
+#and with blend the video is played at fps with the frames in between blended from their neighbors (what
+#ffmpeg's framerate filter does), which makes slow timelapses look smooth.
+#frames are written in capture order on one background thread, so capturing never waits for the encoder
+class VideoExport():
+    def __init__(self, file : str, width : int, height : int, frame_rate : float=3.0, fps : float=20.0,
+                 blend : bool=True) -> None:
+        self.file = file
+        self.width = width
+        self.height = height
+        self.frame_rate = frame_rate
+        self.fps = fps if blend else frame_rate
+        self.blend = blend
+
+        self.process = None
+        self.writer = None
+        self.previous = None
+        self.failed = False
+
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='video-writer')
+        self.writes = deque()
+        self.max_queued = 4
+
+        os.makedirs(os.path.dirname(os.path.abspath(file)), exist_ok=True)
+        ffmpeg = shutil.which('ffmpeg')
+
+        if (ffmpeg is not None):
+            self._open_ffmpeg(ffmpeg)
+        else:
+            self._open_opencv()
+
+    def _open_ffmpeg(self, ffmpeg : str) -> None:
+        filters = 'vflip'
+
+        if (self.blend):
+            filters += f',framerate=fps={self.fps}'
+
+        #yuv420p needs even sizes, the last row or column is dropped if they aren't
+        filters += ',crop=trunc(iw/2)*2:trunc(ih/2)*2'
+
+        command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                   '-s', f'{self.width}x{self.height}', '-framerate', str(self.frame_rate), '-i', '-',
+                   '-vf', filters, '-c:v', 'libx264', '-pix_fmt', 'yuv420p', self.file]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def _open_opencv(self) -> None:
+        import cv2
+
+        self.writer = cv2.VideoWriter(self.file, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (self.width, self.height))
+
+        if (not self.writer.isOpened()):
+            raise RuntimeError(f'Failed to open {self.file} for writing.')
+
+    #queue a captured (height, width, 4) frame
+    def write(self, pixels : np.ndarray) -> None:
+        while (len(self.writes) >= self.max_queued):
+            self._check_write(self.writes.popleft())
+
+        self.writes.append(self.executor.submit(self._write_frame, pixels))
+
+    def _write_frame(self, pixels : np.ndarray) -> None:
+        if (self.failed):
+            return
+
+        if (self.process is not None):
+            self.process.stdin.write(memoryview(np.ascontiguousarray(pixels)))
+            return
+
+        import cv2
+
+        frame = cv2.cvtColor(np.flipud(pixels), cv2.COLOR_RGBA2BGR)
+
+        #the blended frames between the previous capture and this one
+        if (self.blend and self.previous is not None):
+            steps = max(int(round(self.fps / self.frame_rate)), 1)
+
+            for i in range(1, steps):
+                self.writer.write(cv2.addWeighted(self.previous, 1.0 - i / steps, frame, i / steps, 0.0))
+
+        self.writer.write(frame)
+        self.previous = frame
+
+    def _check_write(self, future) -> None:
+        try:
+            future.result()
+        except Exception as e:
+            #the encoder is gone (e.g. ffmpeg exited), the remaining frames are dropped
+            self.failed = True
+            print(f'Failed to write a frame to {self.file}.')
+            print(e)
+
+    #wait for the queued frames and finish the file
+    def close(self) -> None:
+        while (self.writes):
+            self._check_write(self.writes.popleft())
+
+        self.executor.shutdown()
+
+        if (self.process is not None):
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+            if (self.process.wait() != 0):
+                print(f'ffmpeg failed to encode {self.file}.')
+        else:
+            self.writer.release()
@@ -2,15 +2,13 @@ import wx
 from wx import glcanvas
 from OpenGL.GL import *
 from src.opengl_helper import GLInstance  # Replace with your OpenGL helper class
+from src.timelapse import Timelapse
 import time
 
 import sys
 
 import numpy as np
 
-from glob import glob
-from datetime import datetime
-
 #the canvas that will be used to display the OpenGL scene
 class OpenGLCanvas(glcanvas.GLCanvas):
     def __init__(self, parent, captured_output=None):
@@ -34,8 +32,12 @@ class OpenGLCanvas(glcanvas.GLCanvas):
         self.elapsed = 0.0
         self.prev = 0.0
         self.delta = 0.0
+        #the time of the last timer tick, the camera and the playback move by the time between ticks
+        self.prev_tick = 0.0
 
         self.timelapse_counter = 0
+        #the settings of the timelapses that are encoded straight into a video (see VideoExport)
+        self.timelapse_video = {'frame_rate': 3.0, 'fps': 20.0, 'blend': True}
 
         #used for rotating the camera
         self.last_mouse_pos = None
@@ -43,6 +45,12 @@ class OpenGLCanvas(glcanvas.GLCanvas):
 
         self.prefer_blend_images = False
 
+        #by default the scene is only redrawn when something changes (input, camera movement, the slider,
+        #arriving textures or an active animation). continuous_redraw repaints on every timer tick instead
+        self.continuous_redraw = False
+        self.redraw_pending = False
+        self.animating = False
+
         self.timer = wx.Timer(self)
 
         #bind the events
@@ -57,7 +65,7 @@ class OpenGLCanvas(glcanvas.GLCanvas):
         self.Bind(wx.EVT_TIMER, self._on_timer)
         self.Bind(wx.EVT_CLOSE, self._on_close)
 
-        self.timer.Start(16)  # 60 FPS
+        self._update_timer()
 
     #methods for handling events passed by the main window from the sidebar
     def handle_satellite_toggle(self, satellite, checked):
@@ -66,63 +74,95 @@ class OpenGLCanvas(glcanvas.GLCanvas):
             self.gl.load_satellite(satellite)
             self.objects = self.gl.satellites
         else:
+            #the satellite's buffers and textures are deleted
+            self.SetCurrent(self.context)
             self.gl.remove_satellite(satellite)
             self.objects = self.gl.satellites
 
+        self.request_redraw()
+
     def handle_images_selected(self, satellite, images):
         self.gl.remove_texture_images(satellite)
         self.gl.load_texture_images(satellite, images)
 
-    def handle_slider_value_changed(self, value : int):
-        self.slider_value = value
-
-    def handle_timelapse_click(self, satellites, project_folder, resolution):
-        print('Creating timelapse...')
-        #calculate image pairs based on timestamps
-        timestamp_format = '%Y%m%d_%H%M'
-        image_files = []
-
-        for satellite in satellites:
-            path = project_folder + f'/images/{satellite}/{resolution}/'
+        #the timer keeps running while the textures are streamed in
+        self._update_timer()
+        self.request_redraw()
 
-            if (self.prefer_blend_images):
-                images = glob(path + 'blended*.png')
-            else:
-                images = glob(path + '*.png')
-                images = [i for i in images if 'blended' not in i]
+    #switch the composite computed in the shader from the satellite's band images
+    def handle_recipe_selected(self, satellite, recipe):
+        if satellite not in self.gl.satellites:
+            print(f'Object {satellite} is not loaded.')
+            return
 
-            image_files.extend(images)
+        self.SetCurrent(self.context)
 
-        timestamps = []
+        if self.gl.set_composite_recipe(satellite, recipe):
+            self._update_timer()
+            self.request_redraw()
 
-        for file in image_files:
-            date_str = file.split('_')[-2:]
-            date_str = str(date_str[0] + '_' + date_str[1]).split('.')[0]
-            date = datetime.strptime(date_str, timestamp_format)
-            timestamps.append(date)
-        
-        timestamps = sorted(timestamps) #sort the timestamps and convert them to a string so we can sort the image files
-        ts_str = [date.strftime(timestamp_format) for date in timestamps]
-        ts_str = list(dict.fromkeys(ts_str)) #remove duplicates
-        image_groups = []
+    def handle_slider_value_changed(self, value : int):
+        self.slider_value = value
+        self.gl.playback.seek(value)
+        self.request_redraw()
 
-        for timestamp in ts_str:
-            group = [i for i in image_files if timestamp in i]
-            image_groups.append(tuple(group))
+    #start or stop playing the time series, the timer moves the playhead while it plays
+    def handle_playback_toggle(self, playing : bool):
+        if playing:
+            self.gl.playback.play()
+        else:
+            self.gl.playback.pause()
+
+        self.animating = playing
+        self._update_timer()
+        self.request_redraw()
+
+    #schedule a repaint, several requests before the next paint only cause one redraw
+    def request_redraw(self):
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.Refresh()
+
+    #the timer only needs to run while something changes on its own
+    def _needs_timer(self) -> bool:
+        streaming = self.gl_initialized and not self.gl.is_streaming_idle()
+
+        return self.continuous_redraw or self.animating or streaming or any(self.movement_keys.values())
+
+    def _update_timer(self):
+        if self._needs_timer():
+            if not self.timer.IsRunning():
+                self.prev_tick = time.time()
+                self.timer.Start(16)  # 60 FPS
+        elif self.timer.IsRunning():
+            self.timer.Stop()
+
+    #repaint on every timer tick like older versions, instead of only when something changed
+    def set_continuous_redraw(self, continuous : bool):
+        self.continuous_redraw = continuous
+        self._update_timer()
+        self.request_redraw()
+
+    #with video, the timelapse is encoded into a video instead of being saved as PNGs
+    def handle_timelapse_click(self, satellites, project_folder, resolution, video=False):
+        print('Creating timelapse...')
+        timelapse = Timelapse(self.gl, satellites, project_folder, resolution, self.prefer_blend_images)
 
         self.SetCurrent(self.context)
-        for i in range(len(image_groups)):
-            for image in image_groups[i]:
-                for satellite in satellites:
-                    if satellite in image:
-                        self.gl.remove_texture_images(satellite)
-                        self.gl.load_texture_images(satellite, [image])
-                    
-            self.paintGL()
-            self.gl.capture_image(self.width, self.height, self.timelapse_counter, i, project_folder)
+        timelapse.render(self.paintGL, self.width, self.height, self.timelapse_counter,
+                         self.timelapse_video if video else None)
 
         self.timelapse_counter += 1
 
+    #blend the satellites and fade their limbs in the shader, for images processed without alpha masks
+    def handle_gpu_blending_toggle(self, gpu_blending):
+        self.gl.gpu_blending = gpu_blending
+        self.request_redraw()
+
+    #only images selected afterwards are read from or written to the decoded frame cache
+    def handle_decoded_cache_toggle(self, cache_decoded_frames):
+        self.gl.cache_decoded_frames = cache_decoded_frames
+
     def handle_blend_toggle(self, blend_images):
         self.prefer_blend_images = blend_images
 
@@ -138,7 +178,8 @@ class OpenGLCanvas(glcanvas.GLCanvas):
             self.movement_keys['S'] = True
         elif keycode == ord('D') or keycode == ord('d'):
             self.movement_keys['D'] = True
-        
+
+        self._update_timer()
         event.Skip()
     
     def _on_key_up(self, event):
@@ -153,6 +194,7 @@ class OpenGLCanvas(glcanvas.GLCanvas):
         elif keycode == ord('D') or keycode == ord('d'):
             self.movement_keys['D'] = False
 
+        self._update_timer()
         event.Skip()
 
     def _on_left_down(self, event):
@@ -168,7 +210,7 @@ class OpenGLCanvas(glcanvas.GLCanvas):
         delta = event.GetWheelRotation() / (event.GetWheelDelta() * 100)
         self.camera.adjust_zoom(delta) # Adjust the zoom speed as needed
 
-        self.Refresh()
+        self.request_redraw()
 
     def _on_mouse_move(self, event):
         if not self.mouse_clicked:
@@ -187,6 +229,7 @@ class OpenGLCanvas(glcanvas.GLCanvas):
 
             self.last_mouse_pos = wx.Point(x, y)
             self.camera.rotate_origin(delta_x, delta_y)
+            self.request_redraw()
         
     def _on_resize(self, event):
         if not self.gl_initialized:
@@ -202,10 +245,14 @@ class OpenGLCanvas(glcanvas.GLCanvas):
 
         self.width = width
         self.height = height
+        self.gl.w, self.gl.h = width, height
+
+        self.request_redraw()
 
     def _on_paint(self, event):
         dc = wx.PaintDC(self)
         self.SetCurrent(self.context)
+        self.redraw_pending = False
 
         if not self.gl_initialized:
             self.initializeGL()
@@ -213,10 +260,29 @@ class OpenGLCanvas(glcanvas.GLCanvas):
 
         self.paintGL()
         self.SwapBuffers()
+        #drawing requests the pyramid tiles that became visible, which keeps the timer running until they arrive
+        self._update_timer()
 
     def _on_timer(self, event):
-        self._move_camera()
-        self.Refresh()
+        current = time.time()
+        #paints don't happen on every tick, so the step is measured between ticks. It is clamped so a
+        #stalled event loop doesn't jump the camera
+        delta = min(current - self.prev_tick, 0.1)
+        self.prev_tick = current
+
+        changed = self._move_camera(delta)
+
+        if (self.gl_initialized):
+            self.SetCurrent(self.context)
+            changed = self.gl.playback.advance(delta, self.gl.get_num_frames()) or changed
+            changed = self.gl.stream_textures_step() or changed
+            #playback without loop stops by itself at the end of the series
+            self.animating = self.gl.playback.playing
+
+        if (changed or self.animating or self.continuous_redraw):
+            self.request_redraw()
+
+        self._update_timer()
 
     def _on_close(self, event):
         self.timer.Stop()
@@ -224,21 +290,24 @@ class OpenGLCanvas(glcanvas.GLCanvas):
         [glDeleteShader(shader) for shader in self.shaders.shaders]
         [glDeleteProgram(shader) for shader in self.shaders.program]
 
-        for satellite in self.objects:
+        #removing a satellite also releases its textures
+        for satellite in list(self.objects):
             self.gl.remove_satellite(satellite)
-            self.gl.remove_texture_images(satellite)
 
         event.Skip()
 
-    def _move_camera(self):
+    #returns True if the camera moved
+    def _move_camera(self, delta : float) -> bool:
         if self.movement_keys['W']:
-            self.camera.position += self.camera.forward * self.camera.movement_speed * self.delta
+            self.camera.position += self.camera.forward * self.camera.movement_speed * delta
         if self.movement_keys['S']:
-            self.camera.position -= self.camera.forward * self.camera.movement_speed * self.delta
+            self.camera.position -= self.camera.forward * self.camera.movement_speed * delta
         if self.movement_keys['A']:
-            self.camera.position += self.camera.right * self.camera.movement_speed * self.delta
+            self.camera.position += self.camera.right * self.camera.movement_speed * delta
         if self.movement_keys['D']:
-            self.camera.position -= self.camera.right * self.camera.movement_speed * self.delta
+            self.camera.position -= self.camera.right * self.camera.movement_speed * delta
+
+        return any(self.movement_keys.values())
 
     def initializeGL(self):
         #initialize OpenGL
@@ -261,35 +330,12 @@ class OpenGLCanvas(glcanvas.GLCanvas):
 
         #update the time
         current = time.time()
-        self.delta = current - self.prev
+        #the scene may have been idle for a long time, so don't let a single step jump the camera
+        self.delta = min(current - self.prev, 0.1)
         self.elapsed += self.delta
         self.prev = current
 
         if self.elapsed > 1.0:
             self.elapsed = 0.0
 
-        #for each tile in each satellite, draw the tile with appropriate timeseries index
-        for satellite in self.objects:
-            for i in range(len(self.objects[satellite].textures[self.slider_value])):
-                    glBindVertexArray(self.objects[satellite].vao)
-
-                    glBindBuffer(GL_ARRAY_BUFFER, self.objects[satellite].tbos[i])
-                    glEnableVertexAttribArray(1)
-                    glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 0, None)
-
-                    glUseProgram(self.shaders.program)
-                    self.camera.set_uniforms(self.shaders.program)
-
-                    glUniform1f(glGetUniformLocation(self.shaders.program, "time"), self.elapsed)
-                    glUniform1i(glGetUniformLocation(self.shaders.program, "numLayers"), self.objects[satellite].num_layers)
-                    glUniform1i(glGetUniformLocation(self.shaders.program, "image"), 0)
-
-                    glActiveTexture(GL_TEXTURE0)
-                    glBindTexture(GL_TEXTURE_2D, self.objects[satellite].textures[self.slider_value][i])
-
-                    glDrawElements(GL_TRIANGLES, self.objects[satellite].length, GL_UNSIGNED_INT, None)
-
-        glBindVertexArray(0)
-        glBindBuffer(GL_ARRAY_BUFFER, 0)
-        glBindTexture(GL_TEXTURE_2D, 0)
-        glUseProgram(0)
\ No newline at end of file
+        self.gl.render(self.gl.playback.position, self.elapsed)
\ No newline at end of file
@@ -34,8 +34,13 @@ class MainWindow(wx.Frame):
         self.sidebar.Bind(SidebarWidget.EVT_SATELLITE_TOGGLE, self.on_satellite_toggle)
         self.sidebar.Bind(SidebarWidget.EVT_IMAGE_SELECTION, self.on_images_selected)
         self.sidebar.Bind(SidebarWidget.EVT_SLIDER_CHANGE, self.on_slider_value_changed)
+        self.sidebar.Bind(SidebarWidget.EVT_PLAYBACK_TOGGLE, self.on_playback_toggle)
         self.sidebar.Bind(SidebarWidget.EVT_TIMELAPSE_CLICK, self.on_timelapse_click)
         self.sidebar.Bind(SidebarWidget.EVT_BLEND_IMAGES, self.on_blend_image_click)
+        self.sidebar.Bind(SidebarWidget.EVT_RECIPE_SELECTION, self.on_recipe_selected)
+        self.sidebar.Bind(SidebarWidget.EVT_GPU_BLENDING, self.on_gpu_blending_toggle)
+        self.sidebar.Bind(SidebarWidget.EVT_DECODED_CACHE, self.on_decoded_cache_toggle)
+        self.sidebar.Bind(SidebarWidget.EVT_CONTINUOUS_REDRAW, self.on_continuous_redraw_toggle)
 
         self.Centre()
         self.Show()
@@ -81,16 +86,41 @@ class MainWindow(wx.Frame):
         images = event.files
         self.opengl_canvas.handle_images_selected(satellite, images)
 
+    #when a composite computed in the shader is selected
+    def on_recipe_selected(self, event):
+        satellite = event.satellite
+        recipe = event.recipe
+        self.opengl_canvas.handle_recipe_selected(satellite, recipe)
+
     #when the timeline slider changes
     def on_slider_value_changed(self, event):
         value = event.value
         self.opengl_canvas.handle_slider_value_changed(value)
 
+    #when playback is started or stopped
+    def on_playback_toggle(self, event):
+        playing = event.playing
+        self.opengl_canvas.handle_playback_toggle(playing)
+
     def on_timelapse_click(self, event):
         satellites = event.satellites
         folder = event.folder
         resolution = event.resolution
-        self.opengl_canvas.handle_timelapse_click(satellites, folder, resolution)
+        video = event.video
+        self.opengl_canvas.handle_timelapse_click(satellites, folder, resolution, video)
+
+    #when the render mode changes
+    def on_gpu_blending_toggle(self, event):
+        gpu_blending = event.gpu_blending
+        self.opengl_canvas.handle_gpu_blending_toggle(gpu_blending)
+
+    def on_decoded_cache_toggle(self, event):
+        cache_decoded_frames = event.cache_decoded_frames
+        self.opengl_canvas.handle_decoded_cache_toggle(cache_decoded_frames)
+
+    def on_continuous_redraw_toggle(self, event):
+        continuous = event.continuous
+        self.opengl_canvas.set_continuous_redraw(continuous)
 
     def on_blend_image_click(self, event):
         blend_images = event.blend_images
@@ -58,17 +58,44 @@ class ImageSelectionEvent(wx.PyCommandEvent):
         self.files = files
 
 class TimelapseClickEvent(wx.PyCommandEvent):
-    def __init__(self, evtType, satellites : list, folder : str, resolution : str, id=wx.ID_ANY):
+    def __init__(self, evtType, satellites : list, folder : str, resolution : str, video : bool, id=wx.ID_ANY):
         super().__init__(evtType, id)
         self.satellites = satellites
         self.folder = folder
         self.resolution = resolution
+        self.video = video
         
 class SliderChangeEvent(wx.PyCommandEvent):
     def __init__(self, evtType, value : int, id=wx.ID_ANY):
         super().__init__(evtType, id)
         self.value = value
 
+class PlaybackToggleEvent(wx.PyCommandEvent):
+    def __init__(self, evtType, playing : bool, id=wx.ID_ANY):
+        super().__init__(evtType, id)
+        self.playing = playing
+
+class RecipeSelectionEvent(wx.PyCommandEvent):
+    def __init__(self, evtType, satellite : str, recipe : str, id=wx.ID_ANY):
+        super().__init__(evtType, id)
+        self.satellite = satellite
+        self.recipe = recipe
+
+class GpuBlendingToggleEvent(wx.PyCommandEvent):
+    def __init__(self, evtType, gpu_blending : bool, id=wx.ID_ANY):
+        super().__init__(evtType, id)
+        self.gpu_blending = gpu_blending
+
+class DecodedCacheToggleEvent(wx.PyCommandEvent):
+    def __init__(self, evtType, cache_decoded_frames : bool, id=wx.ID_ANY):
+        super().__init__(evtType, id)
+        self.cache_decoded_frames = cache_decoded_frames
+
+class ContinuousRedrawToggleEvent(wx.PyCommandEvent):
+    def __init__(self, evtType, continuous : bool, id=wx.ID_ANY):
+        super().__init__(evtType, id)
+        self.continuous = continuous
+
 class BlendImagesToggleEvent(wx.PyCommandEvent):
     def __init__(self, evtType, blend_images : bool, id=wx.ID_ANY):
         super().__init__(evtType, id)
@@ -90,9 +117,24 @@ class SidebarWidget(wx.Panel):
     myEVT_SLIDER_CHANGE = wx.NewEventType()
     EVT_SLIDER_CHANGE = wx.PyEventBinder(myEVT_SLIDER_CHANGE, 1)
 
+    myEVT_PLAYBACK_TOGGLE = wx.NewEventType()
+    EVT_PLAYBACK_TOGGLE = wx.PyEventBinder(myEVT_PLAYBACK_TOGGLE, 1)
+
     myEVT_BLEND_IMAGES = wx.NewEventType()
     EVT_BLEND_IMAGES = wx.PyEventBinder(myEVT_BLEND_IMAGES, 1)
 
+    myEVT_RECIPE_SELECTION = wx.NewEventType()
+    EVT_RECIPE_SELECTION = wx.PyEventBinder(myEVT_RECIPE_SELECTION, 1)
+
+    myEVT_GPU_BLENDING = wx.NewEventType()
+    EVT_GPU_BLENDING = wx.PyEventBinder(myEVT_GPU_BLENDING, 1)
+
+    myEVT_DECODED_CACHE = wx.NewEventType()
+    EVT_DECODED_CACHE = wx.PyEventBinder(myEVT_DECODED_CACHE, 1)
+
+    myEVT_CONTINUOUS_REDRAW = wx.NewEventType()
+    EVT_CONTINUOUS_REDRAW = wx.PyEventBinder(myEVT_CONTINUOUS_REDRAW, 1)
+
     def __init__(self, parent, captured_output):
         wx.Panel.__init__(self, parent)
 
@@ -122,6 +164,9 @@ class SidebarWidget(wx.Panel):
         self.selected_composites = {}
         self.selected_images = {}
         self.blend_images = False
+        self.band_textures = False
+        self.gpu_blending = False
+        self.timelapse_video = False
 
         #initialize button/toggle variables
         self.interval_unit_idx = 0
@@ -163,14 +208,43 @@ class SidebarWidget(wx.Panel):
         slider_label = wx.StaticText(self, label="Timeline:")
         self.slider = wx.Slider(self, value=0, minValue=0, maxValue=0)
         self.slider.Bind(wx.EVT_SCROLL, self.on_slider_change)
+        play_button = wx.ToggleButton(self, label="Play")
+        play_button.Bind(wx.EVT_TOGGLEBUTTON, self.on_play_toggle)
         timelapse_button = wx.Button(self, label="Create Timelapse")
         timelapse_button.Bind(wx.EVT_BUTTON, self.on_timelapse_click)
+        #encode the timelapse into a video instead of saving every frame as an image
+        video_toggle = wx.CheckBox(self, label="Save as video?")
+        video_toggle.SetValue(False)
+        video_toggle.Bind(wx.EVT_CHECKBOX, self.on_timelapse_video_toggle)
         slider_sizer.Add(slider_label, flag=wx.EXPAND|wx.ALL, border=10)
         slider_sizer.Add(self.slider, flag=wx.EXPAND|wx.ALL, border=0)
+        slider_sizer.Add(play_button, flag=wx.EXPAND|wx.ALL, border=2)
         slider_sizer.Add(timelapse_button, flag=wx.EXPAND|wx.ALL, border=2)
+        slider_sizer.Add(video_toggle, flag=wx.EXPAND|wx.ALL, border=2)
 
         top_box.Add(slider_sizer, flag=wx.EXPAND|wx.ALL, border=10)
 
+        #the render mode. With GPU blending, images are processed without alpha masks and blending, and the
+        #viewer blends the satellites and fades their limbs itself
+        gpu_blending_toggle = wx.CheckBox(self, label="GPU blending?")
+        gpu_blending_toggle.SetValue(False)
+        gpu_blending_toggle.Bind(wx.EVT_CHECKBOX, self.on_gpu_blending_toggle)
+        #decoded frames are kept next to the images, so selecting them again loads faster (uses a lot of disk space)
+        decoded_cache_toggle = wx.CheckBox(self, label="Cache decoded frames?")
+        decoded_cache_toggle.SetValue(False)
+        decoded_cache_toggle.Bind(wx.EVT_CHECKBOX, self.on_decoded_cache_toggle)
+
+        #repaint the scene on every timer tick instead of only when something changed
+        continuous_redraw_toggle = wx.CheckBox(self, label="Redraw continuously?")
+        continuous_redraw_toggle.SetValue(False)
+        continuous_redraw_toggle.Bind(wx.EVT_CHECKBOX, self.on_continuous_redraw_toggle)
+
+        options_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        options_sizer.Add(gpu_blending_toggle, flag=wx.EXPAND|wx.ALL, border=2)
+        options_sizer.Add(decoded_cache_toggle, flag=wx.EXPAND|wx.ALL, border=2)
+        options_sizer.Add(continuous_redraw_toggle, flag=wx.EXPAND|wx.ALL, border=2)
+        top_box.Add(options_sizer, flag=wx.EXPAND|wx.ALL, border=2)
+
         #bottom box for the image manager
         bottom_box = wx.BoxSizer(wx.VERTICAL)
         bottom_box.AddSpacer(10)
@@ -194,6 +268,14 @@ class SidebarWidget(wx.Panel):
         bottom_box.Add(composite_label, flag=wx.EXPAND|wx.ALL, border=2)
         bottom_box.Add(self.displayed_composites, flag=wx.EXPAND|wx.ALL, border=2)
 
+        #composites the viewer computes from band images, switching between them doesn't need reprocessing
+        recipe_label = wx.StaticText(self, label="Shader Composite:")
+        self.recipe_combo = wx.ComboBox(self, choices=[], style=wx.CB_READONLY)
+        self.recipe_combo.Bind(wx.EVT_COMBOBOX, self.on_recipe_change)
+
+        bottom_box.Add(recipe_label, flag=wx.EXPAND|wx.ALL, border=2)
+        bottom_box.Add(self.recipe_combo, flag=wx.EXPAND|wx.ALL, border=2)
+
         #date and Interval Selection
         utc_now = datetime.now(timezone.utc)
 
@@ -273,14 +355,19 @@ class SidebarWidget(wx.Panel):
         self.resolution = resolution_button.GetLabel()
         blend_images_toggle = wx.CheckBox(self, label="Apply blending?")
         blend_images_toggle.SetValue(False)
+        #save the bands of the shader composites instead of running satpy for them
+        band_textures_toggle = wx.CheckBox(self, label="Save bands?")
+        band_textures_toggle.SetValue(False)
 
         process_button.Bind(wx.EVT_BUTTON, self.on_process_click)
         resolution_button.Bind(wx.EVT_BUTTON, self.on_resolution_click)
         blend_images_toggle.Bind(wx.EVT_CHECKBOX, self.on_blend_images_toggle)
+        band_textures_toggle.Bind(wx.EVT_CHECKBOX, self.on_band_textures_toggle)
 
         bottom_box.Add(process_button, flag=wx.EXPAND|wx.ALL, border=2)
         processor_sizer.Add(resolution_button, flag=wx.EXPAND|wx.ALL, border=2)
         processor_sizer.Add(blend_images_toggle, flag=wx.EXPAND|wx.ALL, border=2)
+        processor_sizer.Add(band_textures_toggle, flag=wx.EXPAND|wx.ALL, border=2)
         bottom_box.Add(processor_sizer, flag=wx.EXPAND|wx.ALL, border=2)
 
         #add the top and bottom boxes to the sizer
@@ -358,6 +445,12 @@ class SidebarWidget(wx.Panel):
         #post an event to the OpenGL canvas
         wx.PostEvent(self, SliderChangeEvent(self.myEVT_SLIDER_CHANGE, value))
 
+    def on_play_toggle(self, event):
+        playing = event.GetEventObject().GetValue()
+        event.GetEventObject().SetLabel("Pause" if playing else "Play")
+        #post an event to the OpenGL canvas
+        wx.PostEvent(self, PlaybackToggleEvent(self.myEVT_PLAYBACK_TOGGLE, playing))
+
     def on_timelapse_click(self, event):
         names = self.get_satellite_names(self.selected_satellites)
         resolution = self.resolution
@@ -373,7 +466,11 @@ class SidebarWidget(wx.Panel):
         if (selected_folder is not None):
             os.makedirs(selected_folder + '/images/timelapses', exist_ok=True)
             #post an event to the OpenGL canvas
-            wx.PostEvent(self, TimelapseClickEvent(self.myEVT_TIMELAPSE_CLICK, names, selected_folder, resolution))
+            wx.PostEvent(self, TimelapseClickEvent(self.myEVT_TIMELAPSE_CLICK, names, selected_folder, resolution,
+                                                   self.timelapse_video))
+
+    def on_timelapse_video_toggle(self, event):
+        self.timelapse_video = event.IsChecked()
 
     def on_satellite_combo_change(self, event):
         self.update_composites()
@@ -391,6 +488,23 @@ class SidebarWidget(wx.Panel):
             if (composite in self.selected_composites.get(selected_satellite, [])):
                 self.displayed_composites.Check(self.displayed_composites.FindString(composite), True)
 
+        #the composites of the satellite that can be computed in the shader
+        self.recipe_combo.Clear()
+
+        if (selected_satellite in self.composite_helpers):
+            for composite in self.composite_helpers[selected_satellite].get_shader_composites():
+                self.recipe_combo.Append(composite)
+
+    def on_recipe_change(self, event):
+        selected_satellite = self.satellite_combo.GetValue()
+
+        if (not selected_satellite):
+            return
+
+        name = self.get_satellite_names([selected_satellite])[0]
+        #post an event to the OpenGL canvas
+        wx.PostEvent(self, RecipeSelectionEvent(self.myEVT_RECIPE_SELECTION, name, self.recipe_combo.GetValue()))
+
     def on_composite_checkbox_change(self, event):
         selected_satellite = self.satellite_combo.GetValue()
         selected_composites = [self.displayed_composites.GetString(i) for i in self.displayed_composites.GetCheckedItems()]
@@ -458,7 +572,11 @@ class SidebarWidget(wx.Panel):
                 sat_channels = []
 
                 for composite in self.selected_composites[satellite]:
-                    sat_channels.extend(helper.get_composite_channels(composite))
+                    #composites saved as bands only need the bands of their recipe
+                    if (self.band_textures and helper.is_shader_evaluable(composite)):
+                        sat_channels.extend(helper.get_shader_bands(composite))
+                    else:
+                        sat_channels.extend(helper.get_composite_channels(composite))
 
                 sat_channels = list(dict.fromkeys(sat_channels))
                 channels.append(sat_channels)
@@ -491,7 +609,11 @@ class SidebarWidget(wx.Panel):
         if (selected_folder is not None):
             image_processor = ImageProcessor(selected_folder + '/')
             image_processor.add_satellites(composites)
-            image_processor.specify_image_params(self.resolution, self.blend_images)
+            #with GPU blending the viewer blends the raw frames and fades the limbs itself
+            #high resolution frames are too large to upload whole, so the viewer streams them from tile pyramids
+            image_processor.specify_image_params(self.resolution, self.blend_images, raw_frames=self.gpu_blending,
+                                                 band_textures=self.band_textures,
+                                                 tile_pyramids=self.resolution == 'high_res')
             
             try:
                 process_worker_thread = ProcessorWorker(image_processor)
@@ -510,6 +632,23 @@ class SidebarWidget(wx.Panel):
 
         self.resolution = event.GetEventObject().GetLabel()
     
+    def on_gpu_blending_toggle(self, event):
+        self.gpu_blending = event.IsChecked()
+
+        if (self.gpu_blending and self.blend_images):
+            print('Images are processed without CPU blending while GPU blending is on.')
+
+        wx.PostEvent(self, GpuBlendingToggleEvent(self.myEVT_GPU_BLENDING, self.gpu_blending))
+
+    def on_decoded_cache_toggle(self, event):
+        wx.PostEvent(self, DecodedCacheToggleEvent(self.myEVT_DECODED_CACHE, event.IsChecked()))
+
+    def on_continuous_redraw_toggle(self, event):
+        wx.PostEvent(self, ContinuousRedrawToggleEvent(self.myEVT_CONTINUOUS_REDRAW, event.IsChecked()))
+
+    def on_band_textures_toggle(self, event):
+        self.band_textures = event.IsChecked()
+
     def on_blend_images_toggle(self, event):
         self.blend_images = event.IsChecked()
 